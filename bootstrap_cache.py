@@ -0,0 +1,120 @@
+"""On-disk snapshot of the pages DocsPublisher.bootstrap_existing() indexes.
+
+A full bootstrap lists every managed page under docs_root with labels,
+version and the source properties expanded; on a big space that is most
+of the startup time. The snapshot keeps those (trimmed) page records
+between runs, so the next run only lists page ids (no expand) and re-reads
+pages modified since the snapshot or missing from it. Pages that left the
+managed set simply drop out of the id listing.
+
+Label and content-property edits don't bump the page version
+(lastmodified), so such edits made outside the publisher stay unseen until
+the page itself changes: run with --no-bootstrap-cache (or delete the
+file) for a full rebuild.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+# меняется при смене формата записей: старый снимок просто не подходит
+FORMAT = 1
+# CQL сравнивает lastmodified с датой в часовом поясе пользователя токена,
+# а when в version — со смещением сервера; сутки запаса покрывают любую
+# разницу поясов (и часы, пока шёл листинг).
+DELTA_MARGIN = timedelta(days=1)
+
+
+def file_name(base_url: str, docs_root_id: str) -> str:
+    # каталог кэша по умолчанию общий для всех проектов пользователя — свой
+    # снимок на каждый Confluence/root, а не один перезаписываемый
+    h = hashlib.blake2b(f"{base_url}\0{docs_root_id}".encode("utf-8"), digest_size=8).hexdigest()
+    return f"bootstrap-{h}.json"
+
+
+def trim_page(page: dict, prop_keys: Iterable[str]) -> dict:
+    """Only what bootstrap_existing reads: id, title, version, labels, given properties."""
+    meta = page.get("metadata") or {}
+    out: dict[str, Any] = {"id": str(page["id"]), "title": page.get("title")}
+    version = page.get("version")
+    if isinstance(version, dict):
+        out["version"] = {k: version[k] for k in ("number", "when") if k in version}
+    labels = (meta.get("labels") or {}).get("results") or []
+    trimmed_meta: dict[str, Any] = {"labels": {"results": [{"name": l["name"]} for l in labels]}}
+    props = meta.get("properties")
+    if isinstance(props, dict):
+        trimmed_meta["properties"] = {k: props[k] for k in prop_keys if isinstance(props.get(k), dict)}
+    out["metadata"] = trimmed_meta
+    return out
+
+
+def snapshot_ts(pages: Iterable[dict]) -> str:
+    """Newest version.when among the pages (server clock), else now (UTC), as ISO."""
+    newest: datetime | None = None
+    for page in pages:
+        when = (page.get("version") or {}).get("when")
+        if not when:
+            continue
+        try:
+            ts = datetime.fromisoformat(str(when).replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        if newest is None or ts > newest:
+            newest = ts
+    return (newest or datetime.now(timezone.utc)).astimezone(timezone.utc).isoformat()
+
+
+def delta_since(ts: str) -> str:
+    """CQL date literal for `lastmodified >= "..."` covering everything after ts."""
+    since = datetime.fromisoformat(ts) - DELTA_MARGIN
+    return since.strftime("%Y/%m/%d %H:%M")
+
+
+def load(path: str | Path, identity: dict[str, str]) -> Optional[tuple[str, dict[str, dict]]]:
+    """(ts, {page_id: page}) from the snapshot, None if missing/corrupt/for other cql."""
+    try:
+        raw = Path(path).read_bytes()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        if data.get("format") != FORMAT or data.get("identity") != identity:
+            return None
+        delta_since(data["ts"])  # битая дата — полный bootstrap
+        pages = {str(p["id"]): p for p in data["pages"]}
+    except Exception:
+        return None
+    return data["ts"], pages
+
+
+def store(path: str | Path, identity: dict[str, str], ts: str, pages: list[dict]) -> None:
+    data = {"format": FORMAT, "identity": identity, "ts": ts, "pages": pages}
+    path = Path(path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        body = orjson.dumps(data) if orjson is not None else json.dumps(data, ensure_ascii=False).encode("utf-8")
+        # как в converter_cache.store: читатель не должен увидеть недописанный файл
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(body)
+        os.replace(tmp, path)
+    except OSError:
+        # снимок — только ускорение; без него следующий прогон сделает полный bootstrap
+        pass
+
+
+def drop(path: str | Path) -> None:
+    try:
+        Path(path).unlink()
+    except OSError:
+        pass
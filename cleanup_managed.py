@@ -5,13 +5,15 @@ from confl_client import Confluence
 from publish_docs import load_cfg, managed_label_from_cfg
 
 
-def main(cfg_path: str, delete: bool, list_only: bool) -> None:
+def main(cfg_path: str, delete: bool, list_only: bool, workers: int = 8) -> None:
     token = os.getenv("CONF_TOKEN")
     if not token:
         raise SystemExit("Set CONF_TOKEN env var")
 
+    workers = max(1, int(workers))
+
     cfg = load_cfg(cfg_path)
-    conf = Confluence(cfg.base_url, token)
+    conf = Confluence(cfg.base_url, token, pool_maxsize=workers)
 
     managed_label = managed_label_from_cfg(cfg)
     cql = f'ancestor={cfg.docs_root_id} and type=page and label="{managed_label}"'
@@ -23,8 +25,14 @@ def main(cfg_path: str, delete: bool, list_only: bool) -> None:
         print(f"{p['id']}\t{p.get('title')}")
 
     if delete and not list_only:
-        for p in pages:
-            conf.delete_page(p['id'])
+        # Удаление — чистый I/O (RTT на каждую страницу), поэтому держим
+        # несколько DELETE в полёте одновременно.
+        failed = conf.delete_pages([p["id"] for p in pages], workers=workers)
+        if failed:
+            titles = {str(p["id"]): p.get("title") for p in pages}
+            for page_id, err in failed.items():
+                print(f"delete failed: {page_id}\t{titles.get(page_id)}: {err}")
+            raise next(iter(failed.values()))
         print("Deleted.")
 
 
@@ -33,6 +41,7 @@ if __name__ == "__main__":
     ap.add_argument("--cfg", default="publish.yml")
     ap.add_argument("--delete", action="store_true")
     ap.add_argument("--list-only", action="store_true")
+    ap.add_argument("--workers", type=int, default=8, help="Parallel DELETE requests (default: 8)")
     args = ap.parse_args()
 
-    main(args.cfg, delete=args.delete, list_only=args.list_only)
+    main(args.cfg, delete=args.delete, list_only=args.list_only, workers=args.workers)
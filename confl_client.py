@@ -1,16 +1,159 @@
+import gzip
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from typing import Iterator, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Any, Iterable, Iterator, Optional
+
+# orjson заметно быстрее stdlib json на больших storage-телах; без него
+# работаем как раньше.
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    # как orjson: UTF-8 без \uXXXX и без пробелов. Кириллица в \u-escape весит
+    # 6 байт на символ вместо 2 — тело страницы в запросе было бы в ~3 раза больше.
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json(r: requests.Response) -> Any:
+    if orjson is not None:
+        return orjson.loads(r.content)
+    return r.json()
+
+
+def _already_applied(page: dict, payload: dict) -> bool:
+    """Page (expand=body.storage,ancestors) already has payload's title, parent and body."""
+    try:
+        body = page["body"]["storage"]["value"]
+        parent = str(page["ancestors"][-1]["id"]) if page.get("ancestors") else None
+    except (KeyError, TypeError, IndexError):
+        return False
+    return (
+        page.get("title") == payload["title"]
+        and parent == payload["ancestors"][0]["id"]
+        and body == payload["body"]["storage"]["value"]
+    )
+
+
+# Тела меньше этого не сжимаем: выигрыш меньше накладных расходов gzip.
+GZIP_MIN_BYTES = 4096
+# Сколько раз повторять POST на 429 (см. Confluence._send_json)
+POST_429_RETRIES = 5
+
+
+def _retry_after(r: requests.Response, attempt: int) -> float:
+    # Retry-After в секундах; HTTP-date и мусор — обычный backoff как у Retry
+    try:
+        delay = float(r.headers.get("Retry-After", ""))
+    except ValueError:
+        delay = 0.5 * (2 ** attempt)
+    return min(max(delay, 0.0), 60.0)
+
 
 class Confluence:
-    def __init__(self, base_url: str, token: str):
+    def __init__(self, base_url: str, token: str, *, pool_maxsize: int = 32, gzip_requests: bool = False):
         self.base = base_url.rstrip("/")
         self.s = requests.Session()
+        # Сессию дёргают из нескольких потоков (параллельные апдейты/удаление),
+        # поэтому пул соединений должен быть не меньше числа воркеров: так на весь
+        # прогон остаётся ~1 TCP/TLS handshake на хост.
+        # Транзиентные 429/5xx повторяем с backoff (и с учётом Retry-After);
+        # итоговый ответ отдаём как есть, ошибки разбирают сами методы.
+        # POST не идемпотентен: 502/504 от прокси после того, как Confluence уже
+        # создал страницу/property, дал бы дубль или 409 — его тут не повторяем
+        # (429 для POST повторяет _send_json).
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset(["GET", "PUT", "DELETE"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.s.mount("https://", adapter)
+        self.s.mount("http://", adapter)
         self.s.headers.update({
             "Authorization": f"Bearer {token}",
             "Accept": "application/json",
             "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
         })
+        # page_id -> последняя известная версия страницы (из create/update/CQL),
+        # чтобы update_page не делал лишний GET перед каждым PUT.
+        self._versions: dict[str, int] = {}
+        # (page_id, property key) -> версия content property; страницы, созданные
+        # в этом прогоне (у них свойств ещё нет)
+        self._prop_versions: dict[tuple[str, str], int] = {}
+        self._created_pages: set[str] = set()
+        # storage длинных страниц — хорошо сжимаемый XHTML (5-10x); помогает на
+        # медленном аплинке. Если сервер/прокси не понимает Content-Encoding
+        # (415), выключаем до конца прогона.
+        self.gzip_requests = gzip_requests
+
+    def _send_json(self, method: str, url: str, payload: Any) -> requests.Response:
+        # все JSON-тела (страницы, properties, labels) кодируем сами через _dumps
+        # (orjson, если есть), а не через requests json= (stdlib json)
+        body = _dumps(payload)
+        for attempt in range(POST_429_RETRIES + 1):
+            r = self._send_body(method, url, body)
+            # 429 значит, что запрос не обработан — POST тут безопасно повторить
+            if method != "POST" or r.status_code != 429 or attempt == POST_429_RETRIES:
+                return r
+            time.sleep(_retry_after(r, attempt))
+        return r
+
+    def _send_body(self, method: str, url: str, body: bytes) -> requests.Response:
+        if self.gzip_requests and len(body) > GZIP_MIN_BYTES:
+            r = self.s.request(
+                method,
+                url,
+                data=gzip.compress(body, compresslevel=1),
+                headers={"Content-Encoding": "gzip"},
+                timeout=60,
+            )
+            if r.status_code == 415:
+                self.gzip_requests = False
+            elif r.status_code == 400:
+                # Tomcat/Confluence без поддержки Content-Encoding обычно отвечает
+                # не 415, а 400 / ошибкой разбора JSON: повторяем без сжатия один раз
+                plain = self.s.request(method, url, data=body, timeout=60)
+                if plain.status_code != 400:
+                    # без gzip прошло — дело было в сжатии; иначе 400 настоящий
+                    self.gzip_requests = False
+                return plain
+            else:
+                return r
+        return self.s.request(method, url, data=body, timeout=60)
+
+    def _remember_version(self, page: dict) -> None:
+        try:
+            self._versions[str(page["id"])] = int(page["version"]["number"])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    def prime_versions(self, pages: Iterable[dict]) -> None:
+        """Seed the version cache from pages fetched with expand=version (e.g. via cql_iter).
+
+        Inline-expanded content properties (metadata.properties.<key>) are
+        remembered too, so put_property can go straight to PUT.
+        """
+        for page in pages:
+            self._remember_version(page)
+            props = (page.get("metadata") or {}).get("properties")
+            if isinstance(props, dict) and "id" in page:
+                for key, prop in props.items():
+                    if isinstance(prop, dict):
+                        self._remember_prop_version(page["id"], key, prop)
 
     def create_page(self, space: str, parent_id: str, title: str, storage: str):
         payload = {
@@ -20,31 +163,48 @@ class Confluence:
             "ancestors": [{"id": str(parent_id)}],
             "body": {"storage": {"value": storage, "representation": "storage"}},
         }
-        r = self.s.post(f"{self.base}/rest/api/content", json=payload, timeout=60)
+        r = self._send_json("POST", f"{self.base}/rest/api/content", payload)
 
         if not r.ok:
             raise RuntimeError(f"Create page failed: {r.status_code}\n{r.text}")
 
-        return r.json()
+        created = _json(r)
+        self._remember_version(created)
+        self._created_pages.add(str(created.get("id")))
+        return created
 
     def get_page(self, page_id: str, expand="version"):
         r = self.s.get(f"{self.base}/rest/api/content/{page_id}?expand={expand}", timeout=60)
         r.raise_for_status()
-        return r.json()
+        return _json(r)
 
     def update_page(self, page_id: str, space: str, parent_id: str, title: str, storage: str):
-        cur = self.get_page(page_id, expand="version")
-        ver = int(cur["version"]["number"]) + 1
+        page_id = str(page_id)
+        cached = self._versions.get(page_id)
+        if cached is None:
+            cur = self.get_page(page_id, expand="version")
+            cached = int(cur["version"]["number"])
         payload = {
-            "id": str(page_id),
+            "id": page_id,
             "type": "page",
             "title": title,
             "space": {"key": space},
             "ancestors": [{"id": str(parent_id)}],
-            "version": {"number": ver},
+            "version": {"number": cached + 1},
             "body": {"storage": {"value": storage, "representation": "storage"}},
         }
-        r = self.s.put(f"{self.base}/rest/api/content/{page_id}", json=payload, timeout=60)
+        r = self._send_json("PUT", f"{self.base}/rest/api/content/{page_id}", payload)
+        if r.status_code == 409:
+            # кэш устарел (страницу правили параллельно) — перечитываем версию и пробуем ещё раз
+            self._versions.pop(page_id, None)
+            cur = self.get_page(page_id, expand="version,body.storage,ancestors")
+            if _already_applied(cur, payload):
+                # прошлый PUT закоммитился, но ответ потерялся (502/504) и urllib3
+                # повторил его с той же версией — второй PUT дал бы лишнюю версию
+                self._remember_version(cur)
+                return cur
+            payload["version"] = {"number": int(cur["version"]["number"]) + 1}
+            r = self._send_json("PUT", f"{self.base}/rest/api/content/{page_id}", payload)
         if not r.ok:
             raise RuntimeError(
                 "Update page failed\n"
@@ -54,7 +214,9 @@ class Confluence:
                 f"parent_id={parent_id}\n"
                 f"response={r.text}\n"
             )
-        return r.json()
+        updated = _json(r)
+        self._remember_version(updated)
+        return updated
 
     def find_page_by_title(self, space: str, title: str, *, expand: str = "ancestors"):
         """Exact title search in a space (returns first match)."""
@@ -64,26 +226,35 @@ class Confluence:
             timeout=60,
         )
         r.raise_for_status()
-        results = r.json().get("results", []) or []
+        results = _json(r).get("results", []) or []
         return results[0] if results else None
 
     def cql_iter(self, cql: str, *, expand: str = "metadata.labels,ancestors", limit: int = 200) -> Iterator[dict]:
-        """Iterate through Confluence CQL search results."""
-        start = 0
-        while True:
+        """Iterate through Confluence CQL search results.
+
+        The next page is requested in the background while the caller is
+        still consuming the current one, so pagination doesn't stall on RTT.
+        """
+        def fetch(start: int) -> list[dict]:
             r = self.s.get(
                 f"{self.base}/rest/api/content/search",
                 params={"cql": cql, "limit": limit, "start": start, "expand": expand},
                 timeout=60,
             )
             r.raise_for_status()
-            data = r.json()
-            results = data.get("results", []) or []
-            for it in results:
-                yield it
-            if len(results) < limit:
-                return
-            start += limit
+            return _json(r).get("results", []) or []
+
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            start = 0
+            fut = ex.submit(fetch, start)
+            while True:
+                results = fut.result()
+                if len(results) < limit:
+                    yield from results
+                    return
+                start += limit
+                fut = ex.submit(fetch, start)
+                yield from results
 
     def add_labels(self, page_id: str, labels: list[str]) -> None:
         """Add global labels to a page (idempotent-ish)."""
@@ -91,33 +262,94 @@ class Confluence:
         if not labels:
             return
         payload = [{"prefix": "global", "name": l} for l in labels]
-        r = self.s.post(f"{self.base}/rest/api/content/{page_id}/label", json=payload, timeout=60)
+        r = self._send_json("POST", f"{self.base}/rest/api/content/{page_id}/label", payload)
         r.raise_for_status()
 
     def delete_page(self, page_id: str) -> None:
-        r = self.s.delete(f"{self.base}/rest/api/content/{page_id}", timeout=60)
-        r.raise_for_status()
+        failed = self.delete_pages([page_id], workers=1)
+        if failed:
+            raise failed[str(page_id)]
+
+    def delete_pages(self, page_ids: list[str], *, workers: int = 8, chunk_size: int = 50) -> dict[str, Exception]:
+        """Delete many pages over the pooled keep-alive session.
+
+        Confluence has no bulk-delete endpoint, so requests are issued
+        concurrently (at most `workers` in flight) in chunks of `chunk_size`.
+        Returns {page_id: error} for pages that failed; never raises per page.
+        """
+        ids = [str(i) for i in page_ids]
+        failed: dict[str, Exception] = {}
+        if not ids:
+            return failed
+
+        def one(page_id: str) -> None:
+            r = self.s.delete(f"{self.base}/rest/api/content/{page_id}", timeout=60)
+            r.raise_for_status()
+
+        if len(ids) == 1 or workers <= 1:
+            for page_id in ids:
+                try:
+                    one(page_id)
+                except Exception as e:
+                    failed[page_id] = e
+            return failed
+
+        chunk_size = max(1, int(chunk_size))
+        with ThreadPoolExecutor(max_workers=int(workers)) as ex:
+            for i in range(0, len(ids), chunk_size):
+                chunk = ids[i:i + chunk_size]
+                for page_id, fut in zip(chunk, [ex.submit(one, pid) for pid in chunk]):
+                    try:
+                        fut.result()
+                    except Exception as e:
+                        failed[page_id] = e
+        return failed
 
     # Content properties (ключ к upsert)
+    def _remember_prop_version(self, page_id: str, key: str, prop: dict) -> None:
+        try:
+            self._prop_versions[(str(page_id), key)] = int(prop["version"]["number"])
+        except (KeyError, TypeError, ValueError):
+            pass
+
     def put_property(self, page_id: str, key: str, value: dict):
-        # если свойства нет — POST, если есть — PUT (нужна version у prop)
+        # Если версия свойства известна (get_property/прошлый put) — сразу PUT.
+        # На только что созданной нами странице свойства точно нет — сразу POST.
+        # Иначе как раньше: GET, затем POST (404) или PUT (нужна version у prop).
+        page_id = str(page_id)
         url = f"{self.base}/rest/api/content/{page_id}/property/{key}"
-        r = self.s.get(url, timeout=60)
-        if r.status_code == 404:
-            r2 = self.s.post(
-                f"{self.base}/rest/api/content/{page_id}/property",
-                json={"key": key, "value": value},
-                timeout=60,
-            )
-            r2.raise_for_status()
-            return r2.json()
-        r.raise_for_status()
-        prop = r.json()
-        new_version = int(prop["version"]["number"]) + 1
-        payload = {"key": key, "value": value, "version": {"number": new_version}}
-        r3 = self.s.put(url, json=payload, timeout=60)
-        r3.raise_for_status()
-        return r3.json()
+        ver = self._prop_versions.get((page_id, key))
+
+        if ver is None and page_id not in self._created_pages:
+            r = self.s.get(url, timeout=60)
+            if r.status_code != 404:
+                r.raise_for_status()
+                ver = int(_json(r)["version"]["number"])
+
+        if ver is not None:
+            payload = {"key": key, "value": value, "version": {"number": ver + 1}}
+            r3 = self._send_json("PUT", url, payload)
+            if r3.status_code == 409:
+                # версия в кэше устарела — перечитываем и пробуем ещё раз
+                r = self.s.get(url, timeout=60)
+                r.raise_for_status()
+                payload["version"] = {"number": int(_json(r)["version"]["number"]) + 1}
+                r3 = self._send_json("PUT", url, payload)
+            if r3.status_code != 404:
+                r3.raise_for_status()
+                prop = _json(r3)
+                self._remember_prop_version(page_id, key, prop)
+                return prop
+            # свойство удалили — создаём заново
+            self._prop_versions.pop((page_id, key), None)
+
+        r2 = self._send_json(
+            "POST", f"{self.base}/rest/api/content/{page_id}/property", {"key": key, "value": value}
+        )
+        r2.raise_for_status()
+        prop = _json(r2)
+        self._remember_prop_version(page_id, key, prop)
+        return prop
 
 
     def get_property(self, page_id: str, key: str) -> Optional[dict]:
@@ -127,7 +359,31 @@ class Confluence:
         if r.status_code == 404:
             return None
         r.raise_for_status()
-        return r.json()
+        prop = _json(r)
+        self._remember_prop_version(page_id, key, prop)
+        return prop
+
+    def bulk_properties(self, page_ids: Iterable[str], key: str, *, chunk_size: int = 100) -> dict[str, Any]:
+        """Read one content property for many pages via CQL `id in (...)`.
+
+        One search request per `chunk_size` ids instead of a GET per page.
+        Returns {page_id: property value}; pages without the property are
+        simply absent from the result.
+        """
+        ids = [str(i) for i in page_ids]
+        out: dict[str, Any] = {}
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            cql = f"id in ({','.join(chunk)})"
+            # limit > len(chunk): the whole chunk fits in one short page, no extra request
+            for page in self.cql_iter(cql, expand=f"metadata.properties.{key}", limit=len(chunk) + 1):
+                prop = ((page.get("metadata") or {}).get("properties") or {}).get(key)
+                if not isinstance(prop, dict) or "value" not in prop:
+                    continue
+                page_id = str(page["id"])
+                self._remember_prop_version(page_id, key, prop)
+                out[page_id] = prop["value"]
+        return out
 
     def delete_label(self, page_id: str, label: str) -> None:
         """Remove a label from content (query-param form)."""
@@ -141,3 +397,27 @@ class Confluence:
             return
         r.raise_for_status()
 
+    def delete_labels(self, page_id: str, names: Iterable[str], *, workers: int = 4) -> dict[str, Exception]:
+        """Remove several labels from a page.
+
+        There is no bulk endpoint, so the DELETEs go out concurrently.
+        Returns {label: error} for labels that failed; never raises per label.
+        """
+        names = list(dict.fromkeys(str(n) for n in names if n))
+        failed: dict[str, Exception] = {}
+        if len(names) <= 1 or workers <= 1:
+            for name in names:
+                try:
+                    self.delete_label(page_id, name)
+                except Exception as e:
+                    failed[name] = e
+            return failed
+
+        with ThreadPoolExecutor(max_workers=min(int(workers), len(names))) as ex:
+            futures = [ex.submit(self.delete_label, page_id, name) for name in names]
+            for name, fut in zip(names, futures):
+                try:
+                    fut.result()
+                except Exception as e:
+                    failed[name] = e
+        return failed
@@ -2,12 +2,15 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from typing import Callable, Optional, Any
+import functools
 import re
 import os
 import hashlib
+import html
 
 import yaml
 from markdown_it import MarkdownIt
+from markdown_it.common.utils import escapeHtml, unescapeAll
 
 # Optional markdown-it-py plugins. The publisher must not crash if they're
 # missing in the environment where unit tests run.
@@ -21,9 +24,12 @@ try:
 except Exception:  # pragma: no cover
     footnote_plugin = None  # type: ignore
 
-from bs4 import BeautifulSoup
-from bs4.element import CData, NavigableString, Tag
-
+# libyaml-backed loader is much faster than the pure-Python one; same
+# semantics as yaml.safe_load. Not every PyYAML build ships it.
+try:
+    from yaml import CSafeLoader as _YamlLoader  # type: ignore
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader as _YamlLoader  # type: ignore
 
 # ----------------------------
 # Models
@@ -34,7 +40,32 @@ class ConversionResult:
     storage: str
     front_matter: dict[str, Any] = field(default_factory=dict)
     attachments: set[str] = field(default_factory=set)  # filenames only
-    sha256: str = ""  # hash of resulting storage for idempotency
+    # hash of resulting storage for idempotency (change detection only, not
+    # integrity); prefixed with the algorithm so stored values can migrate
+    digest: str = ""
+
+    @property
+    def sha256(self) -> str:
+        """Backward-compatible alias for `digest`."""
+        return self.digest
+
+
+def storage_digest(storage: str | bytes) -> str:
+    """Digest used to detect storage changes (blake2b is ~3x cheaper than sha256).
+
+    Accepts already-encoded UTF-8 bytes so callers that have them don't pay
+    for a second encode.
+    """
+    data = storage.encode("utf-8") if isinstance(storage, str) else storage
+    return "blake2b:" + hashlib.blake2b(data, digest_size=32).hexdigest()
+
+
+def _storage_digest_chunks(chunks: list[str]) -> str:
+    """storage_digest("".join(chunks)) without building the joined bytes."""
+    h = hashlib.blake2b(digest_size=32)
+    for chunk in chunks:
+        h.update(chunk.encode("utf-8"))
+    return "blake2b:" + h.hexdigest()
 
 
 LinkResolver = Callable[[str, Optional[str]], Optional[str]]
@@ -57,11 +88,108 @@ def strip_front_matter(md: str) -> tuple[dict[str, Any], str]:
     if not m:
         return {}, md
     raw = m.group(1)
-    data = yaml.safe_load(raw) or {}
+    data = yaml.load(raw, Loader=_YamlLoader) or {}
     body = md[m.end():]
     return data, body
 
 
+# ----------------------------
+# Storage rendering helpers
+# ----------------------------
+
+def _esc(text: str) -> str:
+    return html.escape(text, quote=False)
+
+
+def _esc_attr(text: str) -> str:
+    return _esc(text).replace('"', "&quot;")
+
+
+# Storage fragments. Values are escaped by the caller (_esc/_esc_attr).
+_PARAM = '<ac:parameter ac:name="{name}">{value}</ac:parameter>'
+_CODE_MACRO = (
+    '<ac:structured-macro ac:name="code">{params}'
+    "<ac:plain-text-body><![CDATA[{code}]]></ac:plain-text-body>"
+    "</ac:structured-macro>\n"
+)
+_DETAILS_MACRO = (
+    '<ac:structured-macro ac:name="details"><ac:rich-text-body><table><tbody>'
+    "{rows}"
+    "</tbody></table></ac:rich-text-body></ac:structured-macro>"
+)
+_DETAILS_ROW = "<tr><th>{label}</th><td>{value}</td></tr>"
+_USER_MENTION = '<ac:link><ri:user ri:username="{username}" /></ac:link>'
+_JIRA_MACRO = '<ac:structured-macro ac:name="jira">' + _PARAM + "</ac:structured-macro>"
+_TIME = '<time datetime="{value}">{text}</time>'
+
+
+# markdown-it render rules that emit Confluence storage directly instead of
+# HTML that has to be re-parsed and rewritten. Per-call state (converter,
+# current_path, collected attachments) travels in the render `env`.
+
+def _render_fence(self, tokens, idx, options, env) -> str:
+    token = tokens[idx]
+    conv: MdToConfluenceStorage = env["conv"]
+    return conv._code_macro(token.content, conv._extract_language(token.info))
+
+
+def _render_code_block(self, tokens, idx, options, env) -> str:
+    conv: MdToConfluenceStorage = env["conv"]
+    return conv._code_macro(tokens[idx].content, "")
+
+
+def _render_image(self, tokens, idx, options, env) -> str:
+    token = tokens[idx]
+    conv: MdToConfluenceStorage = env["conv"]
+    src = (token.attrGet("src") or "").strip()
+    if not src:
+        return ""
+    alt = self.renderInlineAsText(token.children or [], options, env).strip()
+    return conv._image_macro(src, alt, env["attachments"], current_path=env["current_path"])
+
+
+def _render_link_open(self, tokens, idx, options, env) -> str:
+    token = tokens[idx]
+    conv: MdToConfluenceStorage = env["conv"]
+    href = (token.attrGet("href") or "").strip()
+    if href:
+        conv._rewrite_link(token, href, current_path=env["current_path"])
+    return self.renderToken(tokens, idx, options, env)
+
+
+def _render_html_inline(self, tokens, idx, options, env) -> str:
+    # html=False, so the only inline HTML is the tasklists plugin checkbox.
+    # Confluence storage doesn't like raw inputs; replace with unicode.
+    content = tokens[idx].content
+    if content.startswith("<input") and 'type="checkbox"' in content:
+        return "☑ " if " checked" in content else "☐ "
+    return content
+
+
+@functools.lru_cache(maxsize=8)
+def _get_md(with_tasklists: bool, with_footnotes: bool) -> MarkdownIt:
+    """Configured parser, built once per process and shared by all converters.
+
+    Sharing is safe (also across threads): parse state lives in per-call
+    tokens and the render rules keep per-call data in `env`.
+    """
+    md = (
+        MarkdownIt("commonmark", {"html": False, "linkify": True})
+        .enable("table")
+        .enable("strikethrough")
+    )
+    if with_tasklists:
+        md = md.use(tasklists_plugin, enabled=True)
+    if with_footnotes:
+        md = md.use(footnote_plugin)
+    md.add_render_rule("fence", _render_fence)
+    md.add_render_rule("code_block", _render_code_block)
+    md.add_render_rule("image", _render_image)
+    md.add_render_rule("link_open", _render_link_open)
+    md.add_render_rule("html_inline", _render_html_inline)
+    return md
+
+
 # ----------------------------
 # Converter
 # ----------------------------
@@ -124,68 +252,121 @@ class MdToConfluenceStorage:
         self.code_theme = code_theme
         self.code_linenumbers = code_linenumbers
 
-        self._has_tasklist_plugin = tasklists_plugin is not None
-        md = (
-            MarkdownIt("commonmark", {"html": False, "linkify": True})
-            .enable("table")
-            .enable("strikethrough")
+        # Fragments that only depend on constructor options
+        self._code_params = (
+            _PARAM.format(name="theme", value=_esc(self.code_theme))
+            + _PARAM.format(name="linenumbers", value="true" if self.code_linenumbers else "false")
         )
-        if tasklists_plugin is not None:
-            md = md.use(tasklists_plugin, enabled=True)
-        if footnote_plugin is not None:
-            md = md.use(footnote_plugin)
-        self.md = md
+        self._toc = self._toc_macro() if self.inject_toc else ""
 
-    def convert(self, md_text: str, *, current_path: Optional[str] = None) -> ConversionResult:
-        fm, body = strip_front_matter(md_text)
-
-        body = self._normalize_markdown(body)
+        self._has_tasklist_plugin = tasklists_plugin is not None
+        self.md = _get_md(self._has_tasklist_plugin, footnote_plugin is not None)
 
-        # If tasklist plugin is unavailable, do a minimal tasklist replacement
-        # so that "- [x]" becomes "- ☑" and "- [ ]" becomes "- ☐".
+        # Options are fixed per instance, so the text transforms are chosen
+        # once here instead of being re-checked for every page.
+        self._body_steps: list[Callable[[str], str]] = []
+        if (
+            self.strip_title_h1
+            or self.promote_headings
+            or self.strip_heading_numbers
+            or self.heading_numbering_in_text
+        ):
+            self._body_steps.append(self._normalize_markdown)
         if not self._has_tasklist_plugin:
-            body = self._tasklists_md_to_unicode(body)
+            # minimal tasklist replacement: "- [x]" -> "- ☑", "- [ ]" -> "- ☐"
+            self._body_steps.append(self._tasklists_md_to_unicode)
 
-        html = self.md.render(body)
-        soup = BeautifulSoup(html, "html.parser")
+        self._content_steps: list[Callable[[str], str]] = []
+        if self.heading_numbering_css:
+            self._content_steps.append(self._inject_heading_numbering_css)
 
-        attachments: set[str] = set()
+    def convert(self, md_text: str, *, current_path: Optional[str] = None) -> ConversionResult:
+        fm, body = strip_front_matter(md_text)
 
-        if self.heading_numbering_in_text:
-            self._apply_heading_numbering_in_text(soup)
+        for step in self._body_steps:
+            body = step(body)
 
-        if self.heading_numbering_css:
-            self._inject_heading_numbering_css(soup)
+        attachments: set[str] = set()
+        env = {"conv": self, "current_path": current_path, "attachments": attachments}
+        content = self.md.render(body, env)
 
-        self._convert_code_blocks(soup)
-        self._convert_images(soup, attachments, current_path=current_path)
-        self._rewrite_links(soup, current_path=current_path)
-        self._tasklist_inputs_to_unicode(soup)
+        for step in self._content_steps:
+            content = step(content)
 
         # Front-matter driven metadata block (Page Properties) must appear
         # at the very top of the page, before the TOC macro.
-        self._inject_page_properties(soup, fm)
-
-        if self.inject_toc:
-            self._inject_toc(soup)
-
-        # storage is a fragment; Confluence accepts it in body.storage.value
-        storage = soup.decode(formatter="minimal").strip()
-
-        sha256 = hashlib.sha256(storage.encode("utf-8")).hexdigest()
-        return ConversionResult(storage=storage, front_matter=fm, attachments=attachments, sha256=sha256)
-
+        details = self._page_properties(fm)
+
+        parts: list[str] = []
+        if details:
+            parts.append(details)
+        if self._toc:
+            if details:
+                # TOC goes after Page Properties, separated by an empty line
+                parts.append("<p><br /></p>")
+            parts.append(self._toc)
+        parts.append(content)
+
+        # storage is a fragment; Confluence accepts it in body.storage.value.
+        # Same as "".join(parts).strip(), but only the edge chunks are
+        # stripped, so the (large) rendered content isn't copied again.
+        while parts and not parts[0].strip():
+            parts.pop(0)
+        while parts and not parts[-1].strip():
+            parts.pop()
+        if parts:
+            parts[0] = parts[0].lstrip()
+            parts[-1] = parts[-1].rstrip()
+        storage = "".join(parts)
+
+        digest = _storage_digest_chunks(parts)
+        return ConversionResult(storage=storage, front_matter=fm, attachments=attachments, digest=digest)
+
+    # <a> of an unresolved internal link (see _rewrite_link): href is repeated
+    # in data-source-href, which the renderer puts after the other attributes
+    _MARKED_LINK_RE = re.compile(r'<a href="([^"]*)"([^>]*?) data-source-href="\1"')
+
+    def marked_hrefs(self, res: ConversionResult) -> list[str]:
+        """Hrefs (unescaped, in document order) of the links resolve_marked_links would resolve."""
+        if "data-source-href" not in res.storage:
+            return []
+        return [html.unescape(m.group(1)) for m in self._MARKED_LINK_RE.finditer(res.storage)]
+
+    def resolve_marked_links(
+        self, res: ConversionResult, *, current_path: Optional[str] = None
+    ) -> ConversionResult:
+        """
+        Apply link_resolver to a result converted without it.
 
-    def _apply_heading_numbering_in_text(self, soup: BeautifulSoup) -> None:
-        """Compatibility hook.
+        Gives the same storage as convert() with the resolver, but only runs a
+        regex over the marked links, so a page can be converted once (e.g. in
+        a worker process) and have its links resolved later, when the target
+        page ids are known.
+        """
+        resolver = self.link_resolver
+        if not resolver or "data-source-href" not in res.storage:
+            return res
 
-        Headings are already numbered in _normalize_markdown() when
-        heading_numbering_in_text=True.
+        changed = False
 
-        This method is intentionally a no-op: it prevents crashes if older
-        code paths still call it, and avoids double-numbering.
-        """
-        return
+        def repl(m: re.Match[str]) -> str:
+            nonlocal changed
+            # the renderer escaped the href; the resolver saw it unescaped
+            new_href = resolver(html.unescape(m.group(1)), current_path)
+            if not new_href:
+                return m.group(0)
+            changed = True
+            return f'<a href="{escapeHtml(new_href)}"{m.group(2)}'
+
+        storage = self._MARKED_LINK_RE.sub(repl, res.storage)
+        if not changed:
+            return res
+        return ConversionResult(
+            storage=storage,
+            front_matter=res.front_matter,
+            attachments=res.attachments,
+            digest=storage_digest(storage),
+        )
 
 
     # ----------------------------
@@ -194,114 +375,81 @@ class MdToConfluenceStorage:
 
     _JIRA_KEY_RE = re.compile(r"\b([A-Z][A-Z0-9]+-\d+)\b")
 
-    def _inject_page_properties(self, soup: BeautifulSoup, front_matter: dict[str, Any]) -> None:
-        """Inject Page Properties (Details) macro based on YAML front matter.
+    def _page_properties(self, front_matter: dict[str, Any]) -> str:
+        """Build Page Properties (Details) macro based on YAML front matter.
 
         Expected keys in front matter:
           - owner: string (username/email) -> will be rendered as a user mention link
           - creation_date: YYYY-MM-DD -> rendered as a <time> tag
           - task: Jira issue key or URL -> rendered via jira macro
 
-        The macro is inserted at the top of the page. The TOC macro (if enabled)
-        must appear *after* this block.
+        Returns "" when there is nothing to show. The macro goes at the top of
+        the page; the TOC macro (if enabled) must appear *after* this block.
         """
         if not isinstance(front_matter, dict) or not front_matter:
-            return
+            return ""
 
         owner = (str(front_matter.get("owner") or "").strip() or None)
         creation_date = (str(front_matter.get("creation_date") or "").strip() or None)
         task = (str(front_matter.get("task") or "").strip() or None)
 
         if not any([owner, creation_date, task]):
-            return
-
-        macro = soup.new_tag("ac:structured-macro", attrs={"ac:name": "details"})
-        rtb = soup.new_tag("ac:rich-text-body")
-        macro.append(rtb)
-
-        table = soup.new_tag("table")
-        tbody = soup.new_tag("tbody")
-        table.append(tbody)
-        rtb.append(table)
+            return ""
 
-        def add_row(label: str, value_node: Tag | NavigableString | str) -> None:
-            tr = soup.new_tag("tr")
-            th = soup.new_tag("th")
-            th.string = label
-            td = soup.new_tag("td")
+        rows: list[str] = []
 
-            if isinstance(value_node, str):
-                td.string = value_node
-            else:
-                td.append(value_node)
-
-            tr.append(th)
-            tr.append(td)
-            tbody.append(tr)
+        def add_row(label: str, value: str) -> None:
+            rows.append(_DETAILS_ROW.format(label=_esc(label), value=value))
 
         if owner:
-            add_row("Owner", self._user_mention(soup, owner))
+            add_row("Owner", self._user_mention(owner))
 
         if creation_date:
             # Confluence understands <time datetime="YYYY-MM-DD">...</time>
-            t = soup.new_tag("time", attrs={"datetime": creation_date})
-            t.string = creation_date
-            add_row("Creation date", t)
+            add_row("Creation date", _TIME.format(value=_esc_attr(creation_date), text=_esc(creation_date)))
 
         if task:
-            add_row("Task", self._jira_macro(soup, task))
+            add_row("Task", self._jira_macro(task))
 
-        # Insert at the top (before everything, including TOC)
-        soup.insert(0, macro)
+        return _DETAILS_MACRO.format(rows="".join(rows))
 
 
-    def _user_mention(self, soup: BeautifulSoup, owner: str) -> Tag:
+    def _user_mention(self, owner: str) -> str:
         """Return a Confluence user mention link.
 
         Confluence DC/Server commonly supports ri:username. In Cloud the storage
         format prefers ri:account-id, but many SSO setups on DC also use email as
         the username, so this is the best we can do without an extra API lookup.
         """
-        link = soup.new_tag("ac:link")
-        user = soup.new_tag("ri:user", attrs={"ri:username": owner})
-        link.append(user)
-        return link
+        return _USER_MENTION.format(username=_esc_attr(owner))
 
 
-    def _jira_macro(self, soup: BeautifulSoup, task: str) -> Tag:
+    def _jira_macro(self, task: str) -> str:
         """Return a Jira macro for a task value (key or URL)."""
-        macro = soup.new_tag("ac:structured-macro", attrs={"ac:name": "jira"})
-
         m = self._JIRA_KEY_RE.search(task)
         if m:
-            p = soup.new_tag("ac:parameter", attrs={"ac:name": "key"})
-            p.string = m.group(1)
-            macro.append(p)
-        else:
-            # Fallback: keep the URL (some Confluence setups accept url parameter)
-            p = soup.new_tag("ac:parameter", attrs={"ac:name": "url"})
-            p.string = task
-            macro.append(p)
-        return macro
+            return _JIRA_MACRO.format(name="key", value=_esc(m.group(1)))
+        # Fallback: keep the URL (some Confluence setups accept url parameter)
+        return _JIRA_MACRO.format(name="url", value=_esc(task))
 
 
     # ----------------------------
     # Markdown structure normalization
     # ----------------------------
 
-    _FENCE_RE = re.compile(r"^\s*(```|~~~)")
-    _HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*$")
-
-    # Matches: "1.", "1.1", "1.1.", "1)", "1.2.3)" etc (followed by space)
-    _HEADING_NUM_PREFIX_RE = re.compile(
-        r"^\s*(?:\d+\)|\d+\.(?:\d+(?:\.\d+)*)?\.?|\d+(?:\.\d+)+)\s+(.*)$"
+    # One scanner over the whole body that stops only at fence lines and ATX
+    # heading lines (everything else is copied through as slices).
+    # [^\S\n] is "whitespace except newline", so a match never spans lines.
+    # The optional <num> group captures manual numbering in the same pass:
+    # "1.", "1.1", "1.1.", "1)", "1.2.3)" etc (followed by space).
+    _SCAN_RE = re.compile(
+        r"^(?:(?P<fence>[^\S\n]*(?:```|~~~))"
+        r"|(?P<hashes>#{1,6})[^\S\n]+"
+        r"(?:(?P<num>\d+\)|\d+\.(?:\d+(?:\.\d+)*)?\.?|\d+(?:\.\d+)+)[^\S\n]+(?=\S))?"
+        r"(?P<text>[^\n]+?)[^\S\n]*$)",
+        re.MULTILINE,
     )
-
-    def _strip_heading_number_prefix(self, text: str) -> str:
-        if not self.strip_heading_numbers:
-            return text
-        m = self._HEADING_NUM_PREFIX_RE.match(text)
-        return (m.group(1) if m else text).strip()
+    _NEWLINES_RE = re.compile(r"\r\n?")
 
     def _normalize_markdown(self, body: str) -> str:
         """Normalize Markdown heading structure for Confluence.
@@ -319,7 +467,13 @@ class MdToConfluenceStorage:
         ):
             return body
 
+        # markdown-it treats \r\n and \r as \n anyway; normalizing first keeps
+        # the scanner line-oriented on "\n" only.
+        if "\r" in body:
+            body = self._NEWLINES_RE.sub("\n", body)
+
         out: list[str] = []
+        prev = 0
         in_fence = False
         removed_first_h1 = False
 
@@ -328,68 +482,77 @@ class MdToConfluenceStorage:
         max_lvl = max(1, min(max_lvl, 6))
         n1 = n2 = n3 = 0
 
-        for line in body.splitlines(True):
-            # keep original line endings
-            if line.endswith("\r\n"):
-                core, nl = line[:-2], "\r\n"
-            elif line.endswith("\n"):
-                core, nl = line[:-1], "\n"
-            else:
-                core, nl = line, ""
-
-            if self._FENCE_RE.match(core):
+        for m in self._SCAN_RE.finditer(body):
+            if m.group("fence") is not None:
                 in_fence = not in_fence
-                out.append(core + nl)
                 continue
 
-            if not in_fence:
-                m = self._HEADING_RE.match(core)
-                if m:
-                    hashes, text = m.group(1), m.group(2)
-                    level = len(hashes)
-
-                    if level == 1 and self.strip_title_h1 and not removed_first_h1:
-                        removed_first_h1 = True
-                        continue
-
-                    if self.promote_headings and level > 1:
-                        level -= 1
-
-                    text = self._strip_heading_number_prefix(text)
-
-                    # Auto-number headings in text (H1..H3 by default)
-                    if self.heading_numbering_in_text and level <= 3 and level <= max_lvl:
-                        if level == 1:
-                            n1 += 1
-                            n2 = 0
-                            n3 = 0
-                            prefix = f"{n1}. "
-                        elif level == 2:
-                            if n1 == 0:
-                                n1 = 1
-                            n2 += 1
-                            n3 = 0
-                            prefix = f"{n1}.{n2}. "
-                        else:  # level == 3
-                            if n1 == 0:
-                                n1 = 1
-                            if n2 == 0:
-                                n2 = 1
-                            n3 += 1
-                            prefix = f"{n1}.{n2}.{n3}. "
-
-                        # Avoid double-prefix if someone already wrote the same (rare, but still)
-                        if not text.startswith(prefix):
-                            text = prefix + text
-
-                    core = ("#" * level) + " " + text
-
-            out.append(core + nl)
+            if in_fence:
+                continue
 
+            hashes, text = m.group("hashes"), m.group("text")
+            if m.group("num") is not None and not self.strip_heading_numbers:
+                text = body[m.start("num"):m.end("text")]
+            elif self.strip_heading_numbers and text.isspace():
+                text = ""  # "###   " (пустой заголовок)
+            level = len(hashes)
+
+            if level == 1 and self.strip_title_h1 and not removed_first_h1:
+                removed_first_h1 = True
+                out.append(body[prev:m.start()])
+                # drop the whole line including its newline
+                prev = m.end() + 1 if body.startswith("\n", m.end()) else m.end()
+                continue
+
+            if self.promote_headings and level > 1:
+                level -= 1
+
+            # Auto-number headings in text (H1..H3 by default)
+            if self.heading_numbering_in_text and level <= 3 and level <= max_lvl:
+                if level == 1:
+                    n1 += 1
+                    n2 = 0
+                    n3 = 0
+                    prefix = f"{n1}. "
+                elif level == 2:
+                    if n1 == 0:
+                        n1 = 1
+                    n2 += 1
+                    n3 = 0
+                    prefix = f"{n1}.{n2}. "
+                else:  # level == 3
+                    if n1 == 0:
+                        n1 = 1
+                    if n2 == 0:
+                        n2 = 1
+                    n3 += 1
+                    prefix = f"{n1}.{n2}.{n3}. "
+
+                # Avoid double-prefix if someone already wrote the same (rare, but still)
+                if not text.startswith(prefix):
+                    text = prefix + text
+
+            # Unchanged heading line: leave it inside the pending slice.
+            h_end = m.end("hashes")
+            if (
+                level == len(hashes)
+                and h_end + 1 + len(text) == m.end()
+                and body.startswith(" ", h_end)
+                and body.startswith(text, h_end + 1)
+            ):
+                continue
+
+            out.append(body[prev:m.start()])
+            out.append(("#" * level) + " " + text)
+            prev = m.end()
+
+        if not prev:
+            return body
+        out.append(body[prev:])
         return "".join(out)
 
 
-    def _inject_heading_numbering_css(self, soup: BeautifulSoup) -> None:
+    def _inject_heading_numbering_css(self, content: str) -> str:
         """Add CSS-based auto-numbering for headings (H1-H3) without polluting heading text.
 
         Uses Confluence HTML macro (must be enabled). Scoped to .md-content so it won't affect other content/macros.
@@ -397,12 +560,6 @@ class MdToConfluenceStorage:
         max_lvl = int(self.heading_numbering_max_level or 3)
         max_lvl = max(1, min(max_lvl, 6))
 
-        # Wrap existing content (so selectors are scoped)
-        wrapper = soup.new_tag("div", attrs={"class": "md-content"})
-        for node in list(soup.contents):
-            wrapper.append(node.extract())
-        soup.append(wrapper)
-
         # Build CSS for up to 3 levels
         css_lines = [
             ".md-content { counter-reset: h1; }",
@@ -423,160 +580,94 @@ class MdToConfluenceStorage:
 
         css = "<style>\n" + "\n".join(css_lines) + "\n</style>"
 
-        html_macro = soup.new_tag("ac:structured-macro", attrs={"ac:name": "html"})
-        body = soup.new_tag("ac:plain-text-body")
-        body.append(CData(css))
-        html_macro.append(body)
-
-        # Place at the very top; TOC (if enabled) will be inserted above it later
-        soup.insert(0, html_macro)
+        # HTML macro at the very top; content wrapped so selectors are scoped.
+        # TOC (if enabled) is placed above it by convert().
+        return (
+            '<ac:structured-macro ac:name="html"><ac:plain-text-body>'
+            f"<![CDATA[{css}]]>"
+            "</ac:plain-text-body></ac:structured-macro>"
+            f'<div class="md-content">{content}</div>'
+        )
 
-    def _inject_toc(self, soup: BeautifulSoup) -> None:
-        """Insert Confluence TOC macro near the top of the page.
+    def _toc_macro(self) -> str:
+        """Confluence TOC macro for the top of the page.
 
         We wrap the TOC into an Expand macro so it's collapsible ("hideable")
         for readers.
         """
-        toc = soup.new_tag("ac:structured-macro", attrs={"ac:name": "toc"})
-
-        def param(name: str, value: str) -> None:
-            p = soup.new_tag("ac:parameter", attrs={"ac:name": name})
-            p.string = value
-            toc.append(p)
-
-        param("minLevel", str(self.toc_min_level))
-        param("maxLevel", str(self.toc_max_level))
-
-        # Keep TOC clean by default: no bullets and no numbering.
-        param("outline", "true" if self.toc_outline else "false")
-        param("type", str(self.toc_type))
-        param("style", str(self.toc_style))
+        def param(name: str, value: str) -> str:
+            return _PARAM.format(name=name, value=_esc(value))
+
+        toc = (
+            '<ac:structured-macro ac:name="toc">'
+            + param("minLevel", str(self.toc_min_level))
+            + param("maxLevel", str(self.toc_max_level))
+            # Keep TOC clean by default: no bullets and no numbering.
+            + param("outline", "true" if self.toc_outline else "false")
+            + param("type", str(self.toc_type))
+            + param("style", str(self.toc_style))
+            + "</ac:structured-macro>"
+        )
 
         # Make it collapsible via Expand macro.
-        expand = soup.new_tag("ac:structured-macro", attrs={"ac:name": "expand"})
-        p_title = soup.new_tag("ac:parameter", attrs={"ac:name": "title"})
-        p_title.string = "Оглавление"
-        expand.append(p_title)
-        p_expanded = soup.new_tag("ac:parameter", attrs={"ac:name": "expanded"})
-        p_expanded.string = "false"
-        expand.append(p_expanded)
-
-        rtb = soup.new_tag("ac:rich-text-body")
-        rtb.append(toc)
-        expand.append(rtb)
-
-        # Place near the top. If Page Properties (Details) is present,
-        # TOC must go after it, separated by an empty line.
-        insert_at = 0
-        details_found = False
-        for i, node in enumerate(list(soup.contents)):
-            if isinstance(node, NavigableString) and not str(node).strip():
-                continue
-            if (
-                isinstance(node, Tag)
-                and node.name == "ac:structured-macro"
-                and node.get("ac:name") == "details"
-            ):
-                insert_at = i + 1
-                details_found = True
-            else:
-                insert_at = i
-            break
-
-        if details_found:
-            spacer = soup.new_tag("p")
-            spacer.append(soup.new_tag("br"))
-            soup.insert(insert_at, spacer)
-            insert_at += 1
-
-        soup.insert(insert_at, expand)
+        return (
+            '<ac:structured-macro ac:name="expand">'
+            + param("title", "Оглавление")
+            + param("expanded", "false")
+            + f"<ac:rich-text-body>{toc}</ac:rich-text-body>"
+            + "</ac:structured-macro>"
+        )
+
     # ----------------------------
-    # Post-process steps
+    # Render-rule helpers
     # ----------------------------
 
-    def _convert_code_blocks(self, soup: BeautifulSoup) -> None:
+    def _code_macro(self, code_text: str, lang: str) -> str:
         """
-        <pre><code class="language-python">...</code></pre>
-          =>
-        <ac:structured-macro ac:name="code">...</ac:structured-macro>
+        ```python ... ``` => <ac:structured-macro ac:name="code">...</ac:structured-macro>
         """
-        for pre in list(soup.find_all("pre")):
-            code = pre.find("code")
-            if not code:
-                continue
-
-            lang = self._extract_language(code)
-            code_text = code.get_text()
-
-            macro = soup.new_tag("ac:structured-macro", attrs={"ac:name": "code"})
-
-            if lang:
-                p_lang = soup.new_tag("ac:parameter", attrs={"ac:name": "language"})
-                p_lang.string = lang
-                macro.append(p_lang)
-
-            p_theme = soup.new_tag("ac:parameter", attrs={"ac:name": "theme"})
-            p_theme.string = self.code_theme
-            macro.append(p_theme)
-
-            p_ln = soup.new_tag("ac:parameter", attrs={"ac:name": "linenumbers"})
-            p_ln.string = "true" if self.code_linenumbers else "false"
-            macro.append(p_ln)
-
-            body = soup.new_tag("ac:plain-text-body")
-            body.append(CData(code_text))
-            macro.append(body)
-
-            pre.replace_with(macro)
-
-    def _extract_language(self, code_tag: Tag) -> str:
-        cls = code_tag.get("class") or []
-        for c in cls:
-            if c.startswith("language-"):
-                return c.replace("language-", "", 1).strip()
-            if c.startswith("lang-"):
-                return c.replace("lang-", "", 1).strip()
-        return ""
-
-    def _convert_images(
+        params = self._code_params
+        if lang:
+            params = _PARAM.format(name="language", value=_esc(lang)) + params
+        return _CODE_MACRO.format(params=params, code=code_text)
+
+    def _extract_language(self, info: str) -> str:
+        # Same rule as markdown-it's default fence renderer: first word of the
+        # unescaped info string. Most fences are a bare "python"/"" here.
+        if not info:
+            return ""
+        if "\\" in info or "&" in info:
+            info = unescapeAll(info)
+        words = info.split(None, 1)
+        return words[0] if words else ""
+
+    def _image_macro(
         self,
-        soup: BeautifulSoup,
+        src: str,
+        alt: str,
         attachments: set[str],
         *,
         current_path: Optional[str],
-    ) -> None:
+    ) -> str:
         """
-        <img src="relative.png" alt="a"> =>
+        ![a](relative.png) =>
           <ac:image ac:alt="a"><ri:attachment ri:filename="relative.png"/></ac:image>
 
-        <img src="https://..."> =>
+        ![a](https://...) =>
           <ac:image ac:alt="a"><ri:url ri:value="https://..."/></ac:image>
         """
-        for img in list(soup.find_all("img")):
-            src = (img.get("src") or "").strip()
-            alt = (img.get("alt") or "").strip()
+        kind, value = self._resolve_image(src, current_path=current_path)
 
-            if not src:
-                img.decompose()
-                continue
+        alt_attr = f' ac:alt="{_esc_attr(alt)}"' if alt else ""
 
-            kind, value = self._resolve_image(src, current_path=current_path)
-
-            ac_image = soup.new_tag("ac:image")
-            if alt:
-                ac_image.attrs["ac:alt"] = alt
-
-            if kind == "attachment":
-                filename = os.path.basename(value)
-                attachments.add(filename)
-
-                ri_att = soup.new_tag("ri:attachment", attrs={"ri:filename": filename})
-                ac_image.append(ri_att)
-            else:
-                ri_url = soup.new_tag("ri:url", attrs={"ri:value": value})
-                ac_image.append(ri_url)
+        if kind == "attachment":
+            filename = os.path.basename(value)
+            attachments.add(filename)
+            ref = f'<ri:attachment ri:filename="{_esc_attr(filename)}" />'
+        else:
+            ref = f'<ri:url ri:value="{_esc_attr(value)}" />'
 
-            img.replace_with(ac_image)
+        return f"<ac:image{alt_attr}>{ref}</ac:image>"
 
     def _resolve_image(self, src: str, *, current_path: Optional[str]) -> tuple[str, str]:
         if self.image_resolver:
@@ -590,29 +681,28 @@ class MdToConfluenceStorage:
 
         return ("attachment", src)
 
-    def _rewrite_links(self, soup: BeautifulSoup, *, current_path: Optional[str]) -> None:
+    def _rewrite_link(self, token: Any, href: str, *, current_path: Optional[str]) -> None:
         """
-        Rewrite <a href="..."> if link_resolver provided.
+        Rewrite link href if link_resolver provided.
         Also marks unresolved internal md links with data-source-href for later pass.
         """
-        for a in soup.find_all("a"):
-            href = (a.get("href") or "").strip()
-            if not href:
-                continue
-
-            if self.link_resolver:
-                new_href = self.link_resolver(href, current_path)
-                if new_href:
-                    a["href"] = new_href
-                    continue
+        if self.link_resolver:
+            new_href = self.link_resolver(href, current_path)
+            if new_href:
+                token.attrSet("href", new_href)
+                return
 
-            # If looks like internal md link, keep original in data attr for later pass
-            if href.lower().endswith(".md") or ".md#" in href.lower():
-                a["data-source-href"] = href
+        # If looks like internal md link, keep original in data attr for later pass
+        if href.lower().endswith(".md") or ".md#" in href.lower():
+            token.attrSet("data-source-href", href)
 
 
     _TASKLIST_MD_RE = re.compile(r"^(\s*[-*+]\s*)\[\s*([xX ])\s*\]\s+", re.MULTILINE)
 
+    @staticmethod
+    def _tasklist_repl(m: re.Match[str]) -> str:
+        return f"{m.group(1)}{'☑' if m.group(2) in 'xX' else '☐'} "
+
     def _tasklists_md_to_unicode(self, body: str) -> str:
         """Fallback tasklist support when markdown-it plugins are unavailable.
 
@@ -623,22 +713,8 @@ class MdToConfluenceStorage:
           - ☑ done
           - ☐ todo
         """
-        def repl(m: re.Match[str]) -> str:
-            prefix = m.group(1)
-            flag = m.group(2)
-            sym = "☑" if flag.lower() == "x" else "☐"
-            return f"{prefix}{sym} "
-
-        return self._TASKLIST_MD_RE.sub(repl, body)
-
-    def _tasklist_inputs_to_unicode(self, soup: BeautifulSoup) -> None:
-        """
-        markdown-it tasklists plugin emits <input type="checkbox" ...>.
-        Confluence storage doesn't like raw inputs; replace with unicode.
-        """
-        for inp in list(soup.find_all("input")):
-            if (inp.get("type") or "").lower() != "checkbox":
-                continue
-            checked = inp.has_attr("checked")
-            mark = "☑ " if checked else "☐ "
-            inp.replace_with(NavigableString(mark))
+        # Common case: no brackets at all => nothing to scan. (A narrower
+        # check like '"[ ]" in body' would miss "[ x ]", which the regex accepts.)
+        if "[" not in body:
+            return body
+        return self._TASKLIST_MD_RE.sub(self._tasklist_repl, body)
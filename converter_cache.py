@@ -0,0 +1,164 @@
+"""On-disk cache of Markdown -> storage conversion results.
+
+Layout: <cache_dir>/<key[:2]>/<key>.json with a ConversionResult as JSON.
+The key covers the Markdown text, the current path (relative links depend
+on it) and an options fingerprint, so any change to the source, the
+publisher options or the converter code itself misses the cache.
+
+Entries are plain JSON, never pickle: anyone who can commit to the docs
+repo can precompute a key, and a pickle would run code in the CI job that
+holds CONF_TOKEN. For the same reason the default cache dir is outside the
+checkout ($XDG_CACHE_HOME/md-to-confl-publisher). Delete it (or run with
+--clean-cache) if in doubt.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+from converter import md_to_confluence_storage as _md_conv
+from converter.md_to_confluence_storage import ConversionResult, MdToConfluenceStorage
+
+# blake3 (SIMD) заметно быстрее на больших файлах; без него — blake2b из
+# stdlib (тоже быстрее sha256). Ключи у них разные — кэш просто промахнётся.
+try:
+    import blake3 as _blake3  # type: ignore
+except ImportError:  # pragma: no cover
+    _blake3 = None  # type: ignore
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "md-to-confl-publisher",
+)
+
+
+def content_hash(*parts: bytes) -> str:
+    """128-bit hex digest of the NUL-joined parts (change detection, not security)."""
+    h = _blake3.blake3() if _blake3 is not None else hashlib.blake2b(digest_size=16)
+    for i, part in enumerate(parts):
+        if i:
+            h.update(b"\0")
+        h.update(part)
+    return h.hexdigest()[:32]
+
+
+@functools.lru_cache(maxsize=1)
+def _converter_code_hash() -> str:
+    # Результат зависит и от кода конвертера: после обновления публикатора
+    # старые записи просто перестают совпадать.
+    return content_hash(Path(_md_conv.__file__).read_bytes())
+
+
+def options_fingerprint(options: dict[str, Any], *extra: str) -> str:
+    """Stable fingerprint of converter-affecting state.
+
+    `options` are the converter options (toggling toc_style etc.
+    invalidates the cache); `extra` is anything else the output depends on.
+    """
+    return content_hash(
+        _converter_code_hash().encode("ascii"),
+        json.dumps(sorted(options.items()), default=str, ensure_ascii=False).encode("utf-8"),
+        *(part.encode("utf-8") for part in extra),
+    )
+
+
+def cache_key(md_text: str, current_path: Optional[str], opts_fingerprint: str) -> str:
+    return content_hash(
+        md_text.encode("utf-8"), opts_fingerprint.encode("utf-8"), (current_path or "").encode("utf-8")
+    )
+
+
+def _entry_path(cache_dir: Path, key: str) -> Path:
+    return cache_dir / key[:2] / f"{key}.json"
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def load(cache_dir: Path, key: str) -> Optional[ConversionResult]:
+    try:
+        data = _loads(_entry_path(cache_dir, key).read_bytes())
+        res = ConversionResult(
+            storage=data["storage"],
+            front_matter=data["front_matter"],
+            attachments=set(data["attachments"]),
+            digest=data["digest"],
+        )
+    except Exception:
+        # нет записи / битая запись / старый формат — просто пересчитаем
+        return None
+    if not (
+        isinstance(res.storage, str) and isinstance(res.front_matter, dict) and isinstance(res.digest, str)
+    ):
+        return None
+    return res
+
+
+def store(cache_dir: Path, key: str, res: ConversionResult) -> None:
+    data = {
+        "storage": res.storage,
+        "front_matter": res.front_matter,
+        "attachments": sorted(res.attachments),
+        "digest": res.digest,
+    }
+    try:
+        body = _dumps(data)
+        # front matter из YAML бывает не JSON-типов (даты, не-str ключи): такой
+        # результат не кэшируем — из кэша он вернулся бы другим
+        if _loads(body)["front_matter"] != res.front_matter:
+            return
+    except (TypeError, ValueError):
+        return
+    path = _entry_path(cache_dir, key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # пишем во временный файл и переименовываем: параллельные воркеры не
+        # должны увидеть недописанную запись
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(body)
+        os.replace(tmp, path)
+    except OSError:
+        # кэш — только ускорение; read-only FS и т.п. публикацию не роняют
+        pass
+
+
+def convert_cached(
+    conv: MdToConfluenceStorage,
+    md_text: str,
+    current_path: Optional[str],
+    opts_fingerprint: str,
+    *,
+    cache_dir: str | Path = DEFAULT_CACHE_DIR,
+) -> ConversionResult:
+    """conv.convert(md_text, current_path=...) backed by the on-disk cache."""
+    cache_dir = Path(cache_dir)
+    key = cache_key(md_text, current_path, opts_fingerprint)
+    res = load(cache_dir, key)
+    if res is None:
+        res = conv.convert(md_text, current_path=current_path)
+        store(cache_dir, key, res)
+    return res
+
+
+def clean_cache(cache_dir: str | Path = DEFAULT_CACHE_DIR) -> None:
+    shutil.rmtree(cache_dir, ignore_errors=True)
@@ -1,21 +1,34 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import functools
 import hashlib
+import multiprocessing
 import os
 import re
 import posixpath
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from pathlib import Path, PurePosixPath
 from urllib.parse import urlparse, unquote
-from pathlib import Path
-from typing import Optional, List
+from typing import Any, Optional, List
 import shlex
+import subprocess
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import yaml
 
+import bootstrap_cache
+import converter_cache
 from confl_client import Confluence
-from converter.md_to_confluence_storage import MdToConfluenceStorage, strip_front_matter
+from converter.md_to_confluence_storage import (
+    ConversionResult,
+    MdToConfluenceStorage,
+    storage_digest,
+    strip_front_matter,
+)
 
 DEFAULT_MANAGED_LABEL = "managed-docs"
 # Content property key used to store publisher metadata (hidden from normal users)
@@ -26,7 +39,29 @@ LEGACY_SRC_LABEL_PREFIX = "src-"
 VISIBLE_META_LABELS = ("md", "dir", "section")
 
 
-_LABEL_SANITIZE_RE = re.compile(r"[^a-z0-9-]+")
+# всё, что не a-z0-9 (включая "_", пробелы и сами "-"), схлопывается в один "-"
+_LABEL_SANITIZE_RE = re.compile(r"[^a-z0-9]+")
+# то же для ASCII через bytes.translate (C-цикл по таблице): всё кроме a-z0-9 -> "-"
+_LABEL_ASCII_TABLE = bytes(c if (48 <= c <= 57 or 97 <= c <= 122) else 45 for c in range(256))
+# первый H1 в теле (после front matter) — заголовок страницы
+_H1_RE = re.compile(r"^#\s+(.+)$", re.M)
+# Строка changed.txt (пробелы по краям срезаются, пустые строки и "#..." не
+# матчатся). Группа = формат строки, порядок веток = приоритет разбора:
+#   tab    — git name-status через TAB;
+#   path   — "<A|M|D> <путь, возможно с пробелами>";
+#   rename — "R ..." без табов (пути в кавычках);
+#   plain  — вся строка — путь.
+_PATHS_LINE_RE = re.compile(
+    r"^[^\S\n]*(?:"
+    r"(?P<tab>[^\s#][^\n]*?\t[^\n]*?\S)"
+    r"|(?P<op>[AMD])[^\S\n]+(?P<path>\S[^\n]*?)"
+    r"|(?P<rename>R[^\n]*?)"
+    r"|(?P<plain>[^\s#][^\n]*?)"
+    r")[^\S\n]*$",
+    re.M,
+)
+# меньше страниц на конвертацию — пул процессов не окупает свой запуск
+_PROCESS_CONVERT_MIN = 8
 
 
 def sanitize_label(raw: str) -> str | None:
@@ -41,9 +76,13 @@ def sanitize_label(raw: str) -> str | None:
     # common placeholders: <tag>
     if s.startswith("<") and s.endswith(">"):
         s = s[1:-1].strip()
-    s = s.replace("_", "-").replace(" ", "-")
-    s = _LABEL_SANITIZE_RE.sub("-", s)
-    s = re.sub(r"-+", "-", s).strip("-")
+    if s.isascii():
+        # типичный тег — короткий ASCII; isalnum() после lower() == только a-z0-9
+        if not s.isalnum():
+            s = s.encode("ascii").translate(_LABEL_ASCII_TABLE).decode("ascii")
+            s = "-".join(filter(None, s.split("-"))) if "--" in s else s.strip("-")
+    else:
+        s = _LABEL_SANITIZE_RE.sub("-", s).strip("-")
     return s or None
 
 
@@ -52,6 +91,8 @@ def extract_tag_labels(front_matter: dict | None) -> list[str]:
     if not isinstance(front_matter, dict):
         return []
     tags = front_matter.get("tags")
+    if not tags:
+        return []
     out: list[str] = []
     if isinstance(tags, str):
         tags = [t.strip() for t in tags.split(",") if t.strip()]
@@ -61,13 +102,7 @@ def extract_tag_labels(front_matter: dict | None) -> list[str]:
             if s:
                 out.append(s)
     # uniq preserve order
-    seen: set[str] = set()
-    res: list[str] = []
-    for t in out:
-        if t not in seen:
-            seen.add(t)
-            res.append(t)
-    return res
+    return list(dict.fromkeys(out))
 
 
 def managed_label_from_cfg(cfg: "Cfg") -> str:
@@ -90,7 +125,9 @@ def managed_label_from_cfg(cfg: "Cfg") -> str:
 
 
 
+@functools.lru_cache(maxsize=4096)
 def _sha1(s: str) -> str:
+    # ключи страниц повторяются (title candidates, src-label, property) — считаем раз
     return hashlib.sha1(s.encode("utf-8")).hexdigest()
 
 
@@ -99,6 +136,25 @@ def _label_for(key: str) -> str:
     return "src-" + _sha1(key)[:12]
 
 
+def _read_props(page: dict) -> dict | None:
+    """page.metadata.properties from an expanded CQL result (None if not expanded)."""
+    props = (page.get("metadata") or {}).get("properties")
+    return props if isinstance(props, dict) else None
+
+
+def _read_prop(page: dict, key: str) -> Any:
+    """Value of an inline-expanded content property (None if the page has none)."""
+    prop = (_read_props(page) or {}).get(key)
+    return prop.get("value") if isinstance(prop, dict) else None
+
+
+def _prop_key(value: Any) -> str | None:
+    """`key` from a PROPERTY_KEY/"source" property value (None if absent)."""
+    if isinstance(value, dict):
+        return value.get("key") or None
+    return None
+
+
 def _norm_posix(p: str) -> str:
     # 1) слэши
     p = p.replace("\\", "/")
@@ -110,6 +166,29 @@ def _norm_posix(p: str) -> str:
     return p
 
 
+@functools.lru_cache(maxsize=4096)
+def _resolve_md_target(href: str, current_path: str) -> tuple[str, str] | None:
+    """(docs path, fragment) of a relative link to *.md, or None for other links.
+
+    Depends only on the arguments, so it is memoized: the same hrefs
+    (nav/footer links, "../README.md") repeat across many pages.
+    """
+    u = urlparse(href)
+    if u.scheme or href.startswith("#"):
+        return None
+
+    path = unquote(u.path)
+    if path.startswith("/"):
+        # repo-root relative style
+        path = path.lstrip("/")
+    if not path.lower().endswith(".md"):
+        return None
+
+    cur = PurePosixPath(_norm_posix(current_path))
+    target = _norm_posix((cur.parent / path).as_posix())
+    return target, u.fragment
+
+
 def _humanize(seg: str) -> str:
     seg = seg.replace("_", " ").replace("-", " ").strip()
     if not seg:
@@ -117,7 +196,7 @@ def _humanize(seg: str) -> str:
     return seg[0].upper() + seg[1:]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Cfg:
     base_url: str
     space: str
@@ -128,9 +207,43 @@ class Cfg:
     options: dict
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class ConverterOpts:
+    """MdToConfluenceStorage options, parsed from cfg.options once.
+
+    Field names match the converter's keyword arguments.
+    """
+
+    inject_toc: bool = True
+    toc_min_level: int = 1
+    toc_max_level: int = 3
+    toc_style: str = "none"
+    toc_outline: bool = False
+    # H1 -> page title; shift headings up; remove manual numbering
+    strip_title_h1: bool = True
+    promote_headings: bool = True
+    strip_heading_numbers: bool = True
+    heading_numbering_in_text: bool = True
+    heading_numbering_css: bool = False
+    heading_numbering_max_level: int = 3
+
+    @classmethod
+    def from_options(cls, options: dict[str, Any]) -> "ConverterOpts":
+        return cls(
+            inject_toc=bool(options.get("toc", True)),
+            toc_min_level=int(options.get("toc_min", 1)),
+            toc_max_level=int(options.get("toc_max", 3)),
+            toc_style=str(options.get("toc_style", "none")),
+            toc_outline=bool(options.get("toc_outline", False)),
+            heading_numbering_in_text=bool(options.get("heading_numbering", True)),
+            heading_numbering_max_level=int(options.get("heading_numbering_max_level", 3)),
+        )
+
+
+@dataclass(frozen=True, slots=True)
 class Entry:
     path: Path
+    # _norm_posix(str(path)) — считается один раз при сборе entries
     current_path: str
     md_text: str
     title: str
@@ -140,21 +253,41 @@ class Entry:
     # rename support (git name-status "R" lines)
     rename_from_key: str | None = None
     rename_from_path: str | None = None
+    # converter_cache.content_hash(md_text): сверяется с content_sha в PROPERTY_KEY до конвертации
+    content_sha: str = ""
 
 
-@dataclass
+@dataclass(slots=True)
 class Change:
     op: str  # A/M/R/D
     path: str
     new_path: str | None = None
 
 
-def _is_under_docs(p: str, docs_dir: Path) -> bool:
-    docs = _norm_posix(docs_dir.as_posix()).rstrip("/")
-    return p == docs or p.startswith(docs + "/")
+def _abs_posix(p: str | Path, base: str) -> str:
+    """Absolute, lexically normalized posix path (relative p is taken from base).
+
+    Без resolve(): симлинки не раскрываем (симлинк на .md вне docs_dir — всё
+    равно файл под docs_dir) и не делаем realpath-сисколлов на каждый файл.
+    """
+    s = os.fspath(p)
+    if not os.path.isabs(s):
+        s = os.path.join(base, s)
+    return _norm_posix(s)
+
+
+def _rel_to_docs(p: str | Path, docs_root: str, base: str) -> tuple[str, ...] | None:
+    """Parts of p below docs_root (an _abs_posix path), None if p is outside."""
+    a = _abs_posix(p, base)
+    if a == docs_root:
+        return ()
+    prefix = docs_root if docs_root.endswith("/") else docs_root + "/"
+    if not a.startswith(prefix):
+        return None
+    return tuple(a[len(prefix):].split("/"))
 
 
-def _parse_paths_file(paths_file: Path, docs_dir: Path) -> List[Change]:
+def _parse_paths_file(paths_file: Path, docs_dir: Path, root: Path | None = None) -> List[Change]:
     """
     Reads changed paths list and returns structured changes.
 
@@ -175,25 +308,38 @@ def _parse_paths_file(paths_file: Path, docs_dir: Path) -> List[Change]:
          R "docs/old name.md" "docs/new name.md"
 
     Notes:
+      - Paths are relative to the repo root `root` (default: cwd), like
+        `git diff --name-status` output; docs_dir may be relative or absolute.
       - Non-tab rename WITHOUT quotes and WITH spaces is ambiguous and will be skipped.
       - Paths outside docs_dir are ignored.
       - Non-.md paths are ignored.
     """
+    # utf-8-sig strips BOM if someone saved the file "creatively"
+    return _parse_paths_text(paths_file.read_text(encoding="utf-8-sig"), docs_dir, root)
+
+
+def _parse_paths_text(text: str, docs_dir: Path, root: Path | None = None) -> List[Change]:
+    """Parse a changed-paths list (format: see _parse_paths_file)."""
     changes: List[Change] = []
 
-    # utf-8-sig strips BOM if someone saved the file "creatively"
-    text = paths_file.read_text(encoding="utf-8-sig")
+    # Пути в списке — от корня репы ("docs/..."), а docs_dir в конфиге может быть
+    # и абсолютным: сравниваем абсолютные root/<путь> и docs_dir (строковый
+    # префикс по имени каталога совпал бы и с чужим docs/ где-то в репе).
+    # Пути в Change — как в списке, нормализованные (_norm_posix один раз на строку).
+    base = os.fspath(Path.cwd() if root is None else root)
+    docs_root = _abs_posix(docs_dir, base)
 
-    for raw in text.splitlines():
-        line = raw.strip()
-        if not line or line.startswith("#"):
-            continue
+    def _is_under_docs(p: str) -> bool:
+        return _rel_to_docs(p, docs_root, base) is not None
+
+    # Один проход регэкспа по всему тексту: он же режет строки, срезает пробелы
+    # по краям, пропускает пустые строки/комментарии и определяет формат строки.
+    for m in _PATHS_LINE_RE.finditer(text):
+        kind = m.lastgroup
 
         # --- 1) TAB-delimited (best for CI; matches git diff --name-status output)
-        if "\t" in line:
-            parts = [p for p in line.split("\t") if p != ""]
-            if not parts:
-                continue
+        if kind == "tab":
+            parts = [p for p in m.group("tab").split("\t") if p != ""]
             op = parts[0].strip()
 
             if op.startswith("R"):
@@ -204,7 +350,7 @@ def _parse_paths_file(paths_file: Path, docs_dir: Path) -> List[Change]:
                 new_p = _norm_posix(parts[2])
                 if not (old_p.endswith(".md") and new_p.endswith(".md")):
                     continue
-                if not (_is_under_docs(old_p, docs_dir) or _is_under_docs(new_p, docs_dir)):
+                if not (_is_under_docs(old_p) or _is_under_docs(new_p)):
                     continue
                 changes.append(Change("R", old_p, new_p))
                 continue
@@ -215,7 +361,7 @@ def _parse_paths_file(paths_file: Path, docs_dir: Path) -> List[Change]:
                 p = _norm_posix(parts[1])
                 if not p.endswith(".md"):
                     continue
-                if not _is_under_docs(p, docs_dir):
+                if not _is_under_docs(p):
                     continue
                 changes.append(Change(op, p))
                 continue
@@ -224,16 +370,15 @@ def _parse_paths_file(paths_file: Path, docs_dir: Path) -> List[Change]:
             continue
 
         # --- 2) Status + "rest of line path" (supports spaces)
-        m = re.match(r"^(A|M|D)\s+(.+)$", line)
-        if m:
-            op = m.group(1)
-            p = _norm_posix(m.group(2))
-            if p.endswith(".md") and _is_under_docs(p, docs_dir):
-                changes.append(Change(op, p))
+        if kind == "path":
+            p = _norm_posix(m.group("path"))
+            if p.endswith(".md") and _is_under_docs(p):
+                changes.append(Change(m.group("op"), p))
             continue
 
         # --- 3) Rename without tabs: must be quotable
-        if line.startswith("R"):
+        if kind == "rename":
+            line = m.group("rename")
             try:
                 parts = shlex.split(line)
             except ValueError:
@@ -247,19 +392,45 @@ def _parse_paths_file(paths_file: Path, docs_dir: Path) -> List[Change]:
                 old_p = _norm_posix(parts[1])
                 new_p = _norm_posix(parts[2])
                 if old_p.endswith(".md") and new_p.endswith(".md"):
-                    if _is_under_docs(old_p, docs_dir) or _is_under_docs(new_p, docs_dir):
+                    if _is_under_docs(old_p) or _is_under_docs(new_p):
                         changes.append(Change("R", old_p, new_p))
             # если без кавычек и со спейсами, оно всё равно развалится и сюда не попадёт корректно
             continue
 
         # --- 4) Plain path (whole line is path; supports spaces)
-        p = _norm_posix(line)
-        if p.endswith(".md") and _is_under_docs(p, docs_dir):
+        p = _norm_posix(m.group("plain"))
+        if p.endswith(".md") and _is_under_docs(p):
             changes.append(Change("M", p))
-            continue
 
     return changes
 
+
+def _git_changes(base: str, docs_dir: Path) -> List[Change] | None:
+    """Changes under docs_dir from `git diff --name-status <base>...HEAD`.
+
+    Same line format as a paths file (A/M/D/R<score> TAB-delimited), so the
+    output goes through the same parser. Paths are relative to the cwd
+    (--relative), like docs_dir. Returns None if git is unavailable or the
+    diff fails — the caller then falls back to the full scan.
+    """
+    try:
+        proc = subprocess.run(
+            # core.quotepath=off: иначе не-ASCII имена (кириллица) приходят в кавычках и \ooo-escape
+            [
+                "git", "-c", "core.quotepath=off", "diff", "--name-status", "-M", "--relative",
+                f"{base}...HEAD", "--", docs_dir.as_posix(),
+            ],
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"git diff against {base} failed, publishing all: {e}")
+        return None
+    return _parse_paths_text(proc.stdout, docs_dir)
+
+
 def load_cfg(path: str) -> Cfg:
     raw = yaml.safe_load(Path(path).read_text(encoding="utf-8")) or {}
 
@@ -285,6 +456,11 @@ def load_cfg(path: str) -> Cfg:
     }
     options = raw.get("options") or {}
 
+    # каталоги — строки; пустой title в yaml (`strategy:`) сразу заменяем на
+    # _humanize, чтобы не вычислять его заново на каждый файл
+    domain_title_map = {str(k): (v or _humanize(str(k))) for k, v in domain_title_map.items()}
+    section_title_map = {str(k): (v or _humanize(str(k))) for k, v in section_title_map.items()}
+
     return Cfg(
         base_url=base_url,
         space=space,
@@ -300,12 +476,45 @@ def guess_title(md_text: str, fallback: str) -> str:
     fm, body = strip_front_matter(md_text)
     if isinstance(fm, dict) and fm.get("title"):
         return str(fm["title"]).strip()
-    m = re.search(r"^#\s+(.+)$", body, re.M)
+    m = _H1_RE.search(body)
     if m:
         return m.group(1).strip()
     return fallback
 
 
+def _context_path(base_url: str) -> str:
+    """Confluence context path for page links ("/wiki", or "" at the host root)."""
+    parsed = urlparse(base_url)
+    base_path = (parsed.path or "").rstrip("/")
+    if base_path.endswith("/rest/api"):
+        base_path = base_path[: -len("/rest/api")]
+    if base_path and not base_path.startswith("/"):
+        base_path = "/" + base_path
+    return base_path
+
+
+def _sorted_subdirs(d: Path) -> list[Path]:
+    # DirEntry.is_dir() берёт тип из readdir, без лишнего stat на каждую запись
+    with os.scandir(d) as it:
+        return sorted((Path(e.path) for e in it if e.is_dir()), key=lambda p: p.name)
+
+
+def _read_md(p: Path) -> str:
+    return p.read_text(encoding="utf-8")
+
+
+def _read_all_bodies(paths: list[Path], workers: int = 32) -> list[str]:
+    """Тексты файлов в порядке paths.
+
+    Чтение — чистый I/O (холодный page cache, сетевые ФС, антивирус): запросы
+    идут параллельно из потоков, и ОС может их перекрывать.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        return [_read_md(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=min(workers, len(paths))) as ex:
+        return list(ex.map(_read_md, paths))
+
+
 def find_index_file(dir_path: Path) -> Path | None:
     for name in ("_index.md", "README.md", "readme.md"):
         p = dir_path / name
@@ -322,34 +531,55 @@ def children_macro() -> str:
     )
 
 
+def _make_converter(opts: ConverterOpts, link_resolver: Optional[Any] = None) -> MdToConfluenceStorage:
+    return MdToConfluenceStorage(link_resolver=link_resolver, **asdict(opts))
+
+
+def _conv_key(md_text: str, current_path: str) -> tuple[str, str]:
+    # путь в той же нормализации, что ключи path_to_page (_norm_posix);
+    # сам текст: hash() строки кэшируется в объекте, текст и так держит Entry
+    return (_norm_posix(current_path), md_text)
+
+
+# Конвертер воркер-процесса DocsPublisher._preconvert (строится один раз на процесс)
+_worker_conv: MdToConfluenceStorage | None = None
+
+
+def _init_convert_worker(opts: ConverterOpts) -> None:
+    global _worker_conv
+    _worker_conv = _make_converter(opts)
+
+
+def _convert_worker(md_text: str, current_path: str) -> ConversionResult:
+    assert _worker_conv is not None
+    return _worker_conv.convert(md_text, current_path=current_path)
+
+
 class DocsPublisher:
     def __init__(self, cfg: Cfg, token: str):
         self.cfg = cfg
-        self.conf = Confluence(cfg.base_url, token)
+        parallel = max(1, int(cfg.options.get("parallel", 8)))
+        self.conf = Confluence(
+            cfg.base_url,
+            token,
+            # потоки страниц + по запросу меток на каждый (см. _meta_pool)
+            pool_maxsize=max(32, 2 * parallel),
+            gzip_requests=bool(cfg.options.get("gzip_requests", False)),
+        )
+        # add_labels страницы идёт параллельно с put_property (запросы независимы);
+        # parallel: 1 — всё строго последовательно. Пул живёт только на время
+        # publish_all/publish_file (см. _meta_requests), вне их — последовательно.
+        self._meta_workers = parallel
+        self._meta_pool: ThreadPoolExecutor | None = None
         self.managed_label = managed_label_from_cfg(cfg)
+        self._docs_root_id = str(cfg.docs_root_id)
+        self._base_path = _context_path(cfg.base_url)
 
-        toc = bool(cfg.options.get("toc", True))
-        toc_min = int(cfg.options.get("toc_min", 1))
-        toc_max = int(cfg.options.get("toc_max", 3))
-        toc_style = str(cfg.options.get("toc_style", "none"))
-        toc_outline = bool(cfg.options.get("toc_outline", False))
-        heading_numbering = bool(cfg.options.get("heading_numbering", True))
-        heading_numbering_max_level = int(cfg.options.get("heading_numbering_max_level", 3))
-
-        self.conv_plain = MdToConfluenceStorage(
-            inject_toc=toc,
-            toc_min_level=toc_min,
-            toc_max_level=toc_max,
-            toc_style=toc_style,
-            toc_outline=toc_outline,
-            # H1 -> page title; shift headings up; remove manual numbering
-            strip_title_h1=True,
-            promote_headings=True,
-            strip_heading_numbers=True,
-            heading_numbering_in_text=heading_numbering,
-            heading_numbering_css=False,
-            heading_numbering_max_level=heading_numbering_max_level,
-        )
+        # conv.convert() не хранит состояния между вызовами, поэтому оба
+        # конвертера общие на все файлы (и на потоки publish_all)
+        self.converter_opts = ConverterOpts.from_options(cfg.options)
+        self.conv_plain = self._build_converter(with_resolver=False)
+        self.conv_pass2 = self._build_converter(with_resolver=True)
 
         # заполняется после pass1
         self.path_to_page: dict[str, str] = {}
@@ -358,6 +588,54 @@ class DocsPublisher:
         self.key_to_page: dict[str, str] = {}
         # legacy: src-hash labels -> pageId (will be removed during migration)
         self.label_to_page: dict[str, str] = {}
+        # pageId -> labels страницы (из bootstrap / созданные нами), чтобы не слать
+        # DELETE на метки, которых у страницы нет
+        self.page_labels: dict[str, set[str]] = {}
+        # title -> pageId управляемых страниц под root (из bootstrap), чтобы
+        # усыновление по title не ходило в REST на каждую коллизию
+        self.title_to_page_under_root: dict[str, str] = {}
+        # обратная карта: при смене title страницы в прогоне старый title из
+        # карты выше убираем (см. _remember_title)
+        self._title_by_page: dict[str, str] = {}
+        # publish_all публикует страницы в несколько потоков; составные правки
+        # индексов выше (rename: проверить + переложить) делаем под этим lock
+        self._index_lock = threading.Lock()
+        # усыновление по title и create — под одним lock (см. ensure_page, шаги 2-3);
+        # страницы, созданные в этом прогоне, никогда не усыновляем: это чужой файл
+        self._create_lock = threading.Lock()
+        self._created_titles: set[str] = set()
+        self._created_ids: set[str] = set()
+        # (current_path, md_text) -> результат conv_plain; в pass2 Phase B
+        # только дорезолвливает в нём ссылки (см. _convert)
+        self._conv_cache: dict[tuple[str, str], ConversionResult] = {}
+        # source key -> последний записанный в PROPERTY_KEY payload (body_hash и т.п.);
+        # ensure_page по нему пропускает неизменные страницы
+        self.key_to_prop: dict[str, dict] = {}
+
+        # Кэш результатов конвертации на диске (см. converter_cache); "" / false — выключен
+        cache_dir = cfg.options.get("convert_cache_dir", converter_cache.DEFAULT_CACHE_DIR)
+        self._convert_cache_dir: str | None = str(cache_dir) if cache_dir else None
+        self._plain_fp = converter_cache.options_fingerprint(asdict(self.converter_opts))
+
+        # что сделали со страницами за прогон (итог печатает publish_all одной строкой)
+        self.stats: Counter[str] = Counter()
+        self._stats_lock = threading.Lock()
+
+        # Снимок bootstrap на диске (см. bootstrap_cache); по умолчанию рядом с
+        # кэшем конвертации, "" / false — выключен
+        snap = cfg.options.get("bootstrap_cache_file")
+        if snap is None:
+            snap = Path(cache_dir or converter_cache.DEFAULT_CACHE_DIR) / bootstrap_cache.file_name(
+                cfg.base_url, str(cfg.docs_root_id)
+            )
+        self._bootstrap_cache_file: str | None = str(snap) if snap else None
+        # (identity, страницы) последнего bootstrap — save_bootstrap_cache пишет их в конце прогона
+        # (файл удаляется, как только bootstrap его прочитал: убитый прогон не оставит
+        # снимок со страницами, которые он успел поменять)
+        self._bootstrap_snapshot: tuple[dict[str, str], list[dict]] | None = None
+        # страницы, которые прогон менял (тело, labels, properties): labels/properties
+        # не меняют lastmodified, поэтому в снимок их не кладём — следующий прогон перечитает
+        self._written_pages: set[str] = set()
 
     # -------- discovery --------
     def bootstrap_existing(self) -> None:
@@ -373,30 +651,29 @@ class DocsPublisher:
 
         migrate_legacy = bool(self.cfg.options.get("migrate_legacy_src_labels", True))
 
-        for page in self.conf.cql_iter(cql, expand="metadata.labels,ancestors"):
+        # version нужна update_page (иначе каждый апдейт начинается с лишнего GET),
+        # properties — чтобы не читать source-ключ отдельным запросом на страницу
+        expand = f"metadata.labels,version,metadata.properties.{PROPERTY_KEY},metadata.properties.source"
+        pages = self._bootstrap_pages(cql, expand)
+        self.conf.prime_versions(pages)
+
+        for page in pages:
             page_id = str(page["id"])
+            if page.get("title"):
+                self._remember_title(page_id, str(page["title"]))
             labels = [l["name"] for l in (page.get("metadata", {}).get("labels", {}).get("results", []) or [])]
 
-            # 1) primary index: content property
-            src_key: str | None = None
-            try:
-                prop = self.conf.get_property(page_id, PROPERTY_KEY)
-                if prop and isinstance(prop.get("value"), dict):
-                    src_key = prop["value"].get("key")
-            except Exception:
-                prop = None
-
-            # fallback: старое/общее имя "source" (если вдруг кто-то уже так публиковал)
-            if not src_key:
-                try:
-                    prop2 = self.conf.get_property(page_id, "source")
-                    if prop2 and isinstance(prop2.get("value"), dict):
-                        src_key = prop2["value"].get("key")
-                except Exception:
-                    pass
+            # 1) primary index: content property (PROPERTY_KEY, fallback — старое/общее
+            #    имя "source", если вдруг кто-то уже так публиковал)
+            values = (_read_prop(page, PROPERTY_KEY), _read_prop(page, "source"))
+            src_value = next((v for v in values if _prop_key(v)), None)
+            src_key = _prop_key(src_value)
 
             if src_key:
                 self.key_to_page[str(src_key)] = page_id
+                # payload прошлой публикации (body_hash и т.п.) — ensure_page сравнит
+                # с ним без отдельного GET property
+                self.key_to_prop[str(src_key)] = src_value
                 # IMPORTANT: in "publish only changed" mode we still need to resolve
                 # links to *already existing* pages. For file:* keys we can reconstruct
                 # the md path and fill path_to_page upfront.
@@ -413,38 +690,145 @@ class DocsPublisher:
             for lb in legacy_src_labels:
                 self.label_to_page[lb] = page_id
 
-            # 3) миграция: если у страницы уже есть property с key, то src-* label больше не нужен
-            if migrate_legacy and src_key and legacy_src_labels:
-                for lb in legacy_src_labels:
-                    try:
-                        self.conf.delete_label(page_id, lb)
-                    except Exception:
-                        # не хотим ронять публикацию из-за прав/глюков удаления labels
-                        pass
+            self.page_labels[page_id] = set(labels)
 
+            # 3) миграция: если у страницы уже есть property с key, то src-* label больше не нужен
+            stale: list[str] = []
+            if migrate_legacy and src_key:
+                stale.extend(legacy_src_labels)
 
             # Также убираем видимые технические метки md/dir/section (метадата теперь в property)
             if bool(self.cfg.options.get("migrate_legacy_doc_labels", True)):
-                for lb2 in VISIBLE_META_LABELS:
-                    if lb2 in labels:
-                        try:
-                            self.conf.delete_label(page_id, lb2)
-                        except Exception:
-                            pass
+                stale.extend(lb2 for lb2 in VISIBLE_META_LABELS if lb2 in labels)
+
+            # не хотим ронять публикацию из-за прав/глюков удаления labels
+            self._drop_labels(page_id, stale)
+
+    def _fetch_bootstrap_pages(self, cql: str, expand: str, *, limit: int = 200) -> list[dict]:
+        pages = [
+            bootstrap_cache.trim_page(page, (PROPERTY_KEY, "source"))
+            for page in self.conf.cql_iter(cql, expand=expand, limit=limit)
+        ]
+        # Если сервер не раскрыл metadata.properties, дочитываем пачкой и кладём
+        # в страницу, как будто раскрыл (так их видит и снимок на диске)
+        not_expanded = [page for page in pages if _read_props(page) is None]
+        if not_expanded:
+            ids = [page["id"] for page in not_expanded]
+            fallback: dict[str, dict] = {PROPERTY_KEY: {}, "source": {}}
+            for key in (PROPERTY_KEY, "source"):
+                try:
+                    fallback[key] = self.conf.bulk_properties(ids, key)
+                except Exception:
+                    pass
+            for page in not_expanded:
+                page["metadata"]["properties"] = {
+                    key: {"key": key, "value": values[page["id"]]}
+                    for key, values in fallback.items()
+                    if page["id"] in values
+                }
+        return pages
+
+    def _bootstrap_pages(self, cql: str, expand: str) -> list[dict]:
+        """Pages for bootstrap_existing: full CQL listing, or the disk snapshot + delta.
+
+        With a snapshot only page ids are listed (no expand); pages modified
+        since the snapshot or absent from it are re-read with `expand`.
+        """
+        identity = {"base_url": self.cfg.base_url, "cql": cql, "expand": expand}
+        snap = bootstrap_cache.load(self._bootstrap_cache_file, identity) if self._bootstrap_cache_file else None
+        if snap is None:
+            pages = self._fetch_bootstrap_pages(cql, expand)
+        else:
+            bootstrap_cache.drop(self._bootstrap_cache_file)
+            ts, cached = snap
+            ids = [str(page["id"]) for page in self.conf.cql_iter(cql, expand="")]
+            delta = f'{cql} and lastmodified >= "{bootstrap_cache.delta_since(ts)}"'
+            fresh = {page["id"]: page for page in self._fetch_bootstrap_pages(delta, expand)}
+            missing = [i for i in ids if i not in fresh and i not in cached]
+            for i in range(0, len(missing), 100):
+                chunk = missing[i:i + 100]
+                # limit > len(chunk): вся пачка — одна короткая страница выдачи
+                for page in self._fetch_bootstrap_pages(f"id in ({','.join(chunk)})", expand, limit=len(chunk) + 1):
+                    fresh[page["id"]] = page
+            # порядок и состав — по листингу: удалённые/ушедшие из-под root выпадают
+            pages = [fresh.get(i) or cached[i] for i in ids if i in fresh or i in cached]
+        self._bootstrap_snapshot = (identity, pages)
+        return pages
+
+    def save_bootstrap_cache(self) -> None:
+        """Write the last bootstrap to disk (minus pages this run wrote labels/properties to)."""
+        if not self._bootstrap_cache_file or self._bootstrap_snapshot is None:
+            return
+        identity, pages = self._bootstrap_snapshot
+        keep = [page for page in pages if page["id"] not in self._written_pages]
+        bootstrap_cache.store(self._bootstrap_cache_file, identity, bootstrap_cache.snapshot_ts(pages), keep)
+
+    def drop_bootstrap_cache(self) -> None:
+        if self._bootstrap_cache_file:
+            bootstrap_cache.drop(self._bootstrap_cache_file)
 
     # -------- low-level upsert --------
+    def _count(self, what: str) -> None:
+        with self._stats_lock:
+            self.stats[what] += 1
+
+    def _stats_summary(self) -> str:
+        order = ("created", "updated", "unchanged", "not converted")
+        return ", ".join(f"{name} {self.stats[name]}" for name in order if self.stats[name])
+
     def _ensure_labels(self, page_id: str, labels: list[str]) -> None:
+        self._written_pages.add(str(page_id))
         self.conf.add_labels(page_id, labels)
+        known = self.page_labels.get(str(page_id))
+        if known is not None:
+            known.update(l.strip().lower() for l in labels if l and l.strip())
+
+    def _drop_labels(self, page_id: str, names: list[str]) -> None:
+        """Best-effort removal of labels; skips labels the page is known not to have."""
+        known = self.page_labels.get(str(page_id))
+        if known is not None:
+            names = [n for n in names if n in known]
+        if not names:
+            return
+        # ошибки удаления (права/глюки) публикацию не роняют
+        self._written_pages.add(str(page_id))
+        self.conf.delete_labels(page_id, names)
+        if known is not None:
+            known.difference_update(names)
+
+    def _remember_title(self, page_id: str, title: str) -> None:
+        page_id = str(page_id)
+        with self._index_lock:
+            old = self._title_by_page.get(page_id)
+            if old is not None and self.title_to_page_under_root.get(old) == page_id:
+                del self.title_to_page_under_root[old]
+            self.title_to_page_under_root[title] = page_id
+            self._title_by_page[page_id] = title
+
+    def _is_claimed(self, page_id: str) -> bool:
+        """Page already belongs to some source key (or was created in this run)."""
+        page_id = str(page_id)
+        return page_id in self._created_ids or page_id in list(self.key_to_page.values())
 
     def _adopt_by_title_under_root(self, title: str) -> str | None:
         if not self.cfg.options.get("adopt_existing_by_title_under_root", True):
             return None
+        if title in self._created_titles:
+            return None
+        known = self.title_to_page_under_root.get(title)
+        if known:
+            # страница другого ключа: усыновив, перезаписали бы чужой файл
+            return None if self._is_claimed(known) else known
+        # не из bootstrap (например, страница без managed label) — спрашиваем Confluence
         found = self.conf.find_page_by_title(self.cfg.space, title, expand="ancestors,metadata.labels")
         if not found:
             return None
         # только если страница под нашим root
         ancestors = found.get("ancestors") or []
-        if not any(str(a.get("id")) == str(self.cfg.docs_root_id) for a in ancestors):
+        root_id = self._docs_root_id
+        if not any(str(a.get("id")) == root_id for a in ancestors):
+            return None
+        if self._is_claimed(found["id"]):
             return None
         return found["id"]
 
@@ -459,6 +843,8 @@ class DocsPublisher:
         extra_labels: list[str],
         page_labels: list[str] | None = None,
         collision_prefix: str | None = None,
+        source_meta: dict[str, Any] | None = None,
+        storage_hash: str | None = None,
     ) -> str:
         """Upsert по computed key (никто ничего руками не пишет).
 
@@ -467,9 +853,16 @@ class DocsPublisher:
           - если title свободен — используем как есть (человеческий)
           - если коллизия — пробуем более “человеческий” вариант с префиксом
           - если и это занято — добавляем короткий хэш
+
+        storage_hash — storage_digest(storage), если он уже посчитан
+        (ConversionResult.digest): большие тела не хэшируем второй раз.
         """
 
         page_labels = list(page_labels or [])
+        source_meta = source_meta or {}
+        key_hash = _sha1(key)
+        body_hash = storage_hash or storage_digest(storage)
+        labels = [self.managed_label] + page_labels
 
         def is_title_exists(err: str) -> bool:
             return "A page with this title already exists" in err or "already exists" in err
@@ -488,23 +881,22 @@ class DocsPublisher:
                     if not base.startswith(pref):
                         out.append(f"{pref} · {base}")
 
-            short = _sha1(key)[:6]
+            short = key_hash[:6]
             out.append(f"{base} [{short}]")
 
             # uniq preserve order
-            seen = set()
-            res = []
-            for t in out:
-                if t not in seen:
-                    seen.add(t)
-                    res.append(t)
-            return res
+            return list(dict.fromkeys(out))
+
+        # один и тот же список для update/create/adopt и проверки неизменности
+        candidates = title_candidates(title)
 
         def try_update(page_id: str) -> str:
             last_err: RuntimeError | None = None
-            for t in title_candidates(title):
+            for t in candidates:
                 try:
+                    self._written_pages.add(str(page_id))
                     self.conf.update_page(page_id, self.cfg.space, parent_id, t, storage)
+                    self._remember_title(page_id, t)
                     return t
                 except RuntimeError as e:
                     last_err = e
@@ -516,9 +908,14 @@ class DocsPublisher:
 
         def try_create() -> tuple[str, str]:
             last_err: RuntimeError | None = None
-            for t in title_candidates(title):
+            for t in candidates:
                 try:
                     created = self.conf.create_page(self.cfg.space, parent_id, t, storage)
+                    self._created_titles.add(t)
+                    self._created_ids.add(str(created["id"]))
+                    self._remember_title(created["id"], t)
+                    # новая страница: labels у неё только те, что мы сейчас добавим
+                    self.page_labels[str(created["id"])] = set()
                     return created["id"], t
                 except RuntimeError as e:
                     last_err = e
@@ -537,62 +934,99 @@ class DocsPublisher:
         def write_source_meta(pid: str, used_title: str, meta_labels: list[str]) -> None:
             # Кладём source key + hash в content property (в UI обычно не видно).
             # И туда же прячем любые технические классификаторы (md/dir/section), чтобы люди их не видели.
-            # Оставляем старое имя "source" для обратной совместимости/дебага.
+            # Старое имя "source" только читаем (bootstrap); писать туда же — по опции
+            # dual_write_legacy_source_property (лишний запрос на каждую страницу).
             payload = {
                 "key": key,
                 "title": used_title,
-                "src_hash": _sha1(key)[:12],
+                "src_hash": key_hash[:12],
                 "meta_labels": [str(x).strip().lower() for x in (meta_labels or []) if str(x).strip()],
+                # для пропуска неизменных страниц (шаг 1 ниже)
+                "body_hash": body_hash,
+                "parent_id": str(parent_id),
+                "page_labels": sorted(set(labels)),
+                # из чего собрано тело (content_sha/opts_sha/links_sha, см. _source_meta)
+                **source_meta,
             }
+            self._written_pages.add(str(pid))
             self.conf.put_property(pid, PROPERTY_KEY, payload)
-            self.conf.put_property(pid, "source", payload)
+            if bool(self.cfg.options.get("dual_write_legacy_source_property", False)):
+                self.conf.put_property(pid, "source", payload)
+            self.key_to_prop[key] = payload
+
+        def write_labels_and_meta(pid: str, used_title: str) -> None:
+            # labels и property — независимые запросы: на медленном канале RTT
+            # не складываются. Снятие meta-labels — после add_labels (тот же набор меток).
+            fut = self._meta_pool.submit(self._ensure_labels, pid, labels) if self._meta_pool else None
+            try:
+                if fut is None:
+                    self._ensure_labels(pid, labels)
+                write_source_meta(pid, used_title, extra_labels)
+            finally:
+                if fut is not None:
+                    fut.result()
             if bool(self.cfg.options.get("migrate_legacy_doc_labels", True)):
-                for lb2 in VISIBLE_META_LABELS:
-                    try:
-                        self.conf.delete_label(pid, lb2)
-                    except Exception:
-                        pass
+                self._drop_labels(pid, list(VISIBLE_META_LABELS))
 
         # 1) основной путь: нашли по content property (невидимо пользователю)
         page_id = self.key_to_page.get(key)
         if page_id:
+            old = self.key_to_prop.get(key)
+            if (
+                old
+                and bool(self.cfg.options.get("skip_unchanged", True))
+                and old.get("body_hash") == body_hash
+                and old.get("parent_id") == str(parent_id)
+                and old.get("title") in candidates
+                and old.get("meta_labels") == [str(x).strip().lower() for x in extra_labels if str(x).strip()]
+            ):
+                # тело/title/родитель те же — не плодим версию страницы;
+                # labels/property трогаем, только если поменялись теги
+                if old.get("page_labels") != sorted(set(labels)):
+                    write_labels_and_meta(page_id, old["title"])
+                elif any(old.get(k) != v for k, v in source_meta.items()):
+                    # тело то же, но из других исходников: обновляем только
+                    # property, чтобы следующий прогон пропустил страницу до convert
+                    write_source_meta(page_id, old["title"], extra_labels)
+                self._count("unchanged")
+                return page_id
             used_title = try_update(page_id)
-            self._ensure_labels(page_id, [self.managed_label] + page_labels)
-            write_source_meta(page_id, used_title, extra_labels)
+            write_labels_and_meta(page_id, used_title)
+            self._count("updated")
             return page_id
 
         # 1b) legacy путь: нашли по src-* label (и мигрируем на property)
         legacy_id = self.label_to_page.get(lb)
         if legacy_id:
             used_title = try_update(legacy_id)
-            self._ensure_labels(legacy_id, [self.managed_label] + page_labels)
-            write_source_meta(legacy_id, used_title, extra_labels)
-            try:
-                self.conf.delete_label(legacy_id, lb)
-            except Exception:
-                pass
+            write_labels_and_meta(legacy_id, used_title)
+            self._drop_labels(legacy_id, [lb])
             self.key_to_page[key] = legacy_id
+            self._count("updated")
             return legacy_id
 
         # 2) попытка “усыновить” существующую страницу под нашим root (прошлые ручные/кривые прогоны)
-        adopted_id = self._adopt_by_title_under_root(title)
+        # 3) иначе create (с обработкой коллизий).
+        # Оба шага под _create_lock: группы разделов публикуются параллельно, и без
+        # него поток мог бы на коллизии title усыновить (и перезаписать) страницу,
+        # которую только что создал соседний поток.
+        with self._create_lock:
+            adopted_id = self._adopt_by_title_under_root(title)
+            if adopted_id:
+                used_title = try_update(adopted_id)
+            else:
+                page_id, used_title = try_create()
         if adopted_id:
-            used_title = try_update(adopted_id)
-            self._ensure_labels(adopted_id, [self.managed_label] + page_labels)
-            write_source_meta(adopted_id, used_title, extra_labels)
+            write_labels_and_meta(adopted_id, used_title)
             # на всякий: если страница уже была в legacy-режиме
-            try:
-                self.conf.delete_label(adopted_id, lb)
-            except Exception:
-                pass
+            self._drop_labels(adopted_id, [lb])
             self.key_to_page[key] = adopted_id
+            self._count("updated")
             return adopted_id
 
-        # 3) create (с обработкой коллизий)
-        page_id, used_title = try_create()
-        self._ensure_labels(page_id, [self.managed_label] + page_labels)
-        write_source_meta(page_id, used_title, extra_labels)
+        write_labels_and_meta(page_id, used_title)
         self.key_to_page[key] = page_id
+        self._count("created")
         return page_id
 # -------- directory pages --------
     def ensure_domain_and_sections(self) -> dict[tuple[str, str], str]:
@@ -603,7 +1037,7 @@ class DocsPublisher:
 
         section_pages: dict[tuple[str, str], str] = {}
 
-        for domain_dir in sorted([p for p in docs_dir.iterdir() if p.is_dir()]):
+        for domain_dir in _sorted_subdirs(docs_dir):
             domain = domain_dir.name
             # игнорируем мусор типа docs/adr
             if domain not in self.cfg.domain_title_map:
@@ -614,9 +1048,10 @@ class DocsPublisher:
             domain_key = f"dir:{_norm_posix(f'docs/{domain}') }"
 
             dom_index = find_index_file(domain_dir)
+            dom_rel = _norm_posix(str(dom_index)) if dom_index else None
             if dom_index:
                 dom_text = dom_index.read_text(encoding="utf-8")
-                dom_storage = self.conv_plain.convert(dom_text, current_path=_norm_posix(str(dom_index))).storage
+                dom_storage = self._convert(self.conv_plain, dom_text, dom_rel).storage
             else:
                 dom_storage = f"<p>{domain_title}</p>"
 
@@ -631,7 +1066,7 @@ class DocsPublisher:
                 collision_prefix="DOCS",
             )
 
-            for sec_dir in sorted([p for p in domain_dir.iterdir() if p.is_dir()]):
+            for sec_dir in _sorted_subdirs(domain_dir):
                 section = sec_dir.name
                 section_title_raw = self.cfg.section_title_map.get(section) or _humanize(section)
                 section_title = f"{domain_title} · {section_title_raw}"
@@ -639,9 +1074,10 @@ class DocsPublisher:
                 sec_key = f"dir:{_norm_posix(f'docs/{domain}/{section}') }"
 
                 sec_index = find_index_file(sec_dir)
+                sec_rel = _norm_posix(str(sec_index)) if sec_index else None
                 if sec_index:
                     sec_text = sec_index.read_text(encoding="utf-8")
-                    sec_storage = self.conv_plain.convert(sec_text, current_path=_norm_posix(str(sec_index))).storage
+                    sec_storage = self._convert(self.conv_plain, sec_text, sec_rel).storage
                 else:
                     sec_storage = f"<p>{section_title_raw}</p>"
 
@@ -659,11 +1095,11 @@ class DocsPublisher:
                 section_pages[(domain, section)] = sec_page_id
 
                 # Для резолва ссылок на _index.md
-                if sec_index:
-                    self.path_to_page[_norm_posix(str(sec_index))] = sec_page_id
+                if sec_rel:
+                    self.path_to_page[sec_rel] = sec_page_id
 
-            if dom_index:
-                self.path_to_page[_norm_posix(str(dom_index))] = domain_page_id
+            if dom_rel:
+                self.path_to_page[dom_rel] = domain_page_id
 
         return section_pages
 
@@ -672,20 +1108,12 @@ class DocsPublisher:
         if not current_path:
             return None
 
-        u = urlparse(href)
-        if u.scheme or href.startswith("#"):
-            return None
-
-        path = unquote(u.path)
-        if path.startswith("/"):
-            # repo-root relative style
-            path = path.lstrip("/")
-        if not path.lower().endswith(".md"):
+        # разбор href кэшируется; path_to_page меняется по ходу публикации,
+        # поэтому сам pageId смотрим каждый раз
+        resolved = _resolve_md_target(href, current_path)
+        if resolved is None:
             return None
-
-        cur = PurePosixPath(_norm_posix(current_path))
-        target = (cur.parent / path).as_posix()
-        target = _norm_posix(target)
+        target, fragment = resolved
 
         page_id = self.path_to_page.get(target)
         if not page_id:
@@ -700,20 +1128,190 @@ class DocsPublisher:
         # Example:
         #   base_url = http://host.docker.internal:8090        -> /pages/viewpage.action?... 
         #   base_url = https://conf.company.ru/wiki           -> /wiki/pages/viewpage.action?...
-        parsed = urlparse(self.cfg.base_url)
-        base_path = (parsed.path or "").rstrip("/")
-        if base_path.endswith("/rest/api"):
-            base_path = base_path[: -len("/rest/api")]
-        if base_path and not base_path.startswith("/"):
-            base_path = "/" + base_path
-
-        url = f"{base_path}/pages/viewpage.action?pageId={page_id}"
-        if u.fragment:
-            url += f"#{u.fragment}"
+        # (context path считается один раз в __init__, см. _context_path)
+        url = f"{self._base_path}/pages/viewpage.action?pageId={page_id}"
+        if fragment:
+            url += f"#{fragment}"
         return url
 
     # -------- publish --------
+    def clean_convert_cache(self) -> None:
+        if self._convert_cache_dir:
+            converter_cache.clean_cache(self._convert_cache_dir)
+
+    def _build_converter(self, *, with_resolver: bool) -> MdToConfluenceStorage:
+        return _make_converter(self.converter_opts, self._link_resolver if with_resolver else None)
+
+    def _convert(self, conv: MdToConfluenceStorage, md_text: str, current_path: str) -> ConversionResult:
+        """conv.convert(), но без повторной конвертации одного и того же файла.
+
+        Файл рендерится один раз conv_plain'ом (результат — в _conv_cache).
+        conv_pass2 отличается только link_resolver'ом, поэтому в pass2 ссылки
+        дорезолвливаются по разметке data-source-href, без повторного рендера.
+        """
+        res = self._plain(md_text, current_path)
+        if conv is not self.conv_plain:
+            res = conv.resolve_marked_links(res, current_path=current_path)
+        return res
+
+    def _plain(self, md_text: str, current_path: str) -> ConversionResult:
+        """Результат conv_plain (из _conv_cache / кэша на диске, иначе конвертирует)."""
+        ck = _conv_key(md_text, current_path)
+        res = self._conv_cache.get(ck)
+        if res is None:
+            res = self._convert_cached(md_text, current_path)
+            self._conv_cache[ck] = res
+        return res
+
+    def _convert_cached(self, md_text: str, current_path: str) -> ConversionResult:
+        if not self._convert_cache_dir:
+            return self.conv_plain.convert(md_text, current_path=current_path)
+        return converter_cache.convert_cached(
+            self.conv_plain, md_text, current_path, self._plain_fp, cache_dir=self._convert_cache_dir
+        )
+
+    def _link_targets(self, plain: ConversionResult, current_path: str) -> list[str]:
+        """Docs paths the page links to (md links marked by conv_plain), sorted."""
+        targets = set()
+        for href in self.conv_plain.marked_hrefs(plain):
+            resolved = _resolve_md_target(href, current_path)
+            if resolved is not None:
+                targets.add(resolved[0])
+        return sorted(targets)
+
+    def _links_digest(self, targets: list[str]) -> str:
+        # storage страницы со ссылками на .md зависит от pageId только тех страниц,
+        # на которые она ссылается (и context path в URL), а не от всей карты
+        # path->pageId: новая/переименованная чужая страница её не инвалидирует
+        if not targets:
+            return ""
+        return converter_cache.content_hash(
+            self._base_path.encode("utf-8"),
+            *(f"{t}\0{self.path_to_page.get(t, '')}".encode("utf-8") for t in targets),
+        )
+
+    def _source_meta(
+        self, content_sha: str, plain: ConversionResult, current_path: str, conv: MdToConfluenceStorage
+    ) -> dict[str, Any]:
+        """Из чего собрано тело страницы; пишется в PROPERTY_KEY рядом с body_hash.
+
+        link_targets сохраняем, чтобы следующий прогон проверил links_sha до
+        конвертации (при том же content_sha цели ссылок те же).
+        """
+        targets = self._link_targets(plain, current_path)
+        if not targets:
+            links_sha = ""
+        elif conv is self.conv_plain:
+            # ссылки не резолвились (pass1 / Phase A)
+            links_sha = "unresolved"
+        else:
+            links_sha = self._links_digest(targets)
+        return {
+            "content_sha": content_sha,
+            "opts_sha": self._plain_fp,
+            "links_sha": links_sha,
+            "link_targets": targets,
+        }
+
+    def _unchanged_page(self, key: str, parent_id: str, content_sha: str, *, check_links: bool) -> str | None:
+        """pageId, если страница опубликована из тех же исходников — тогда не нужна даже конвертация.
+
+        check_links=False — для проходов без link_resolver (pass1 / Phase A): уже
+        опубликованное тело с резолвнутыми ссылками не откатываем на "сырое".
+        """
+        if not bool(self.cfg.options.get("skip_unchanged", True)):
+            return None
+        page_id = self.key_to_page.get(key)
+        old = self.key_to_prop.get(key)
+        if not page_id or not old:
+            return None
+        if (
+            old.get("content_sha") != content_sha
+            or old.get("opts_sha") != self._plain_fp
+            or old.get("parent_id") != str(parent_id)
+            or self.managed_label not in (old.get("page_labels") or [])
+        ):
+            return None
+        if check_links and old.get("links_sha") != self._links_digest(old.get("link_targets") or []):
+            return None
+        return page_id
+
+    def _preconvert(self, entries: list[Entry]) -> None:
+        """Заранее конвертирует страницы пачки в пуле процессов.
+
+        Рендер markdown — чистый CPU под GIL, потоки publish_all его не
+        параллелят. Результаты кладём в _conv_cache (и в кэш на диске), дальше
+        публикация берёт их оттуда. convert_workers: 1 — без пула.
+        """
+        workers = int(self.cfg.options.get("convert_workers", os.cpu_count() or 1))
+        cache_dir = Path(self._convert_cache_dir) if self._convert_cache_dir else None
+
+        todo: dict[tuple[str, str], Entry] = {}
+        for e in entries:
+            ck = _conv_key(e.md_text, e.current_path)
+            if ck in self._conv_cache or ck in todo:
+                continue
+            if cache_dir is not None:
+                res = converter_cache.load(
+                    cache_dir, converter_cache.cache_key(e.md_text, e.current_path, self._plain_fp)
+                )
+                if res is not None:
+                    self._conv_cache[ck] = res
+                    continue
+            todo[ck] = e
+
+        if workers <= 1 or len(todo) < _PROCESS_CONVERT_MIN:
+            # мелочь сконвертируется по ходу публикации
+            return
+
+        workers = min(workers, len(todo))
+        pending = list(todo.values())
+        # не fork: к этому моменту живы потоки _meta_pool и префетча cql_iter, и
+        # дочерний процесс может унаследовать чужой захваченный lock (urllib3 pool,
+        # logging). Воркеру от родителя ничего не нужно — конвертер он строит сам
+        # из converter_opts (_init_convert_worker).
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_convert_worker,
+            initargs=(self.converter_opts,),
+        ) as ex:
+            results = ex.map(
+                _convert_worker,
+                [e.md_text for e in pending],
+                [e.current_path for e in pending],
+                chunksize=max(1, len(pending) // (workers * 4)),
+            )
+            for ck, e, res in zip(todo, pending, results):
+                self._conv_cache[ck] = res
+                if cache_dir is not None:
+                    converter_cache.store(
+                        cache_dir, converter_cache.cache_key(e.md_text, e.current_path, self._plain_fp), res
+                    )
+
+    @contextlib.contextmanager
+    def _meta_requests(self):
+        """Open _meta_pool for the duration of a publish call and shut it down after."""
+        if self._meta_pool is not None or self._meta_workers <= 1:
+            yield
+            return
+        self._meta_pool = ThreadPoolExecutor(max_workers=self._meta_workers)
+        try:
+            yield
+        finally:
+            pool, self._meta_pool = self._meta_pool, None
+            pool.shutdown(wait=True)
+
     def publish_all(self, pass_no: int, paths_file: Path | None = None) -> None:
+        # снимок bootstrap пишем и при падении: страницы, которые прогон успел
+        # тронуть, в него не попадают (см. save_bootstrap_cache)
+        try:
+            with self._meta_requests():
+                self._publish_all(pass_no, paths_file)
+        finally:
+            self.save_bootstrap_cache()
+
+    def _publish_all(self, pass_no: int, paths_file: Path | None) -> None:
         self.bootstrap_existing()
         section_pages = self.ensure_domain_and_sections()
 
@@ -729,50 +1327,75 @@ class DocsPublisher:
         md_files: list[Path] = []
         changes_by_new_path: dict[str, Change] = {}
 
+        # сравниваем абсолютные пути: пути из списка — от корня репы (cwd), а docs_dir
+        # может быть абсолютным; файлы приводим к виду rglob(docs_dir), чтобы
+        # ключи file:... совпадали с полным прогоном
+        cwd = os.getcwd()
+        docs_root = _abs_posix(docs_dir, cwd)
+
+        def docs_form(path: str) -> str:
+            parts = _rel_to_docs(path, docs_root, cwd)
+            return path if parts is None else _norm_posix(docs_dir.joinpath(*parts).as_posix())
+
+        changes: list[Change] | None = None
         if paths_file:
             changes = _parse_paths_file(Path(paths_file), docs_dir)
+        elif self.cfg.options.get("git_incremental_base"):
+            changes = _git_changes(str(self.cfg.options["git_incremental_base"]), docs_dir)
+
+        if changes is not None:
+            missing: list[Path] = []
             for ch in changes:
                 if ch.op == "D":
                     continue  # пока не удаляем страницы
                 if ch.op == "R" and ch.new_path:
-                    changes_by_new_path[_norm_posix(ch.new_path)] = ch
-                    p = Path(_norm_posix(ch.new_path))
+                    ch = Change("R", docs_form(ch.path), docs_form(ch.new_path))
+                    rel = ch.new_path
                 else:
-                    changes_by_new_path[_norm_posix(ch.path)] = ch
-                    p = Path(_norm_posix(ch.path))
+                    ch = Change(ch.op, docs_form(ch.path))
+                    rel = ch.path
+                changes_by_new_path[rel] = ch
+                p = Path(rel)
 
                 if is_regular_md_file(p):
                     md_files.append(p)
                 else:
                     # файл может не существовать (например, переименовали + удалили в одном MR)
                     if p.suffix.lower() == ".md":
-                        print(f"skip (missing or index): {p}")
+                        missing.append(p)
+            if missing:
+                # одним выводом, а не print на файл
+                print("\n".join(f"skip (missing or index): {p}" for p in missing))
         else:
             for p in docs_dir.rglob("*.md"):
                 if is_regular_md_file(p):
                     md_files.append(p)
 
-        # Собираем “единицы публикации” (для двухфазного pass2)
-        entries: list[Entry] = []
+        # Сначала отбираем файлы, которые вообще публикуются (docs/<domain>/<section>/...)
+        candidates: list[tuple[Path, str, str]] = []  # (path, domain, parent_id)
         for p in sorted(md_files):
-            try:
-                under_docs = p.relative_to(docs_dir)
-            except Exception:
-                continue
-
-            uparts = under_docs.parts
-            if len(uparts) < 3:
+            uparts = _rel_to_docs(p, docs_root, cwd)
+            if uparts is None or len(uparts) < 3:
                 continue
 
             domain = uparts[0]
-            section = uparts[1]
-            if (domain, section) not in section_pages:
+            # один probe вместо `in` + []
+            sec_page_id = section_pages.get((domain, uparts[1]))
+            if sec_page_id is None:
                 continue
 
-            parent_id = str(section_pages[(domain, section)])
+            candidates.append((p, domain, str(sec_page_id)))
+
+        # читаем всё пачкой заранее, дальше работаем со строками в памяти
+        texts = _read_all_bodies(
+            [c[0] for c in candidates], workers=int(self.cfg.options.get("read_workers", 32))
+        )
+
+        # Собираем “единицы публикации” (для двухфазного pass2)
+        entries: list[Entry] = []
+        for (p, domain, parent_id), md_text in zip(candidates, texts):
             current_path = _norm_posix(str(p))
 
-            md_text = p.read_text(encoding="utf-8")
             title = guess_title(md_text, fallback=p.stem)
             if title.lower() in ("readme", "index"):
                 title = p.stem
@@ -785,7 +1408,7 @@ class DocsPublisher:
             rename_from_path: str | None = None
             ch = changes_by_new_path.get(current_path)
             if ch and ch.op == "R" and ch.new_path:
-                old_path = _norm_posix(ch.path)
+                old_path = ch.path
                 rename_from_path = old_path
                 rename_from_key = f"file:{old_path}"
 
@@ -800,6 +1423,7 @@ class DocsPublisher:
                     collision_prefix=collision_prefix,
                     rename_from_key=rename_from_key,
                     rename_from_path=rename_from_path,
+                    content_sha=converter_cache.content_hash(md_text.encode("utf-8")),
                 )
             )
 
@@ -807,36 +1431,73 @@ class DocsPublisher:
             # If this is a rename, "pre-adopt" the old page id under the new key,
             # so ensure_page(...) will UPDATE the same page and rewrite PROPERTY_KEY.
             if e.rename_from_key and e.rename_from_key != e.key:
-                old_pid = self.key_to_page.get(e.rename_from_key)
-                if old_pid and e.key not in self.key_to_page:
-                    self.key_to_page[e.key] = old_pid
-
-            res = conv.convert(e.md_text, current_path=e.current_path)
-            page_id = self.ensure_page(
-                key=e.key,
-                title=e.title,
-                parent_id=e.parent_id,
-                storage=res.storage,
-                extra_labels=["md"],
-                page_labels=extract_tag_labels(res.front_matter),
-                collision_prefix=e.collision_prefix,
-            )
-            # Ключ именно такой, как формирует _link_resolver (normpath+unquote)
-            self.path_to_page[e.current_path] = page_id
-
-            # Clean up rename artifacts in in-memory indexes
-            if e.rename_from_path:
-                self.path_to_page.pop(e.rename_from_path, None)
-            if e.rename_from_key and e.rename_from_key != e.key:
-                if self.key_to_page.get(e.rename_from_key) == page_id:
-                    self.key_to_page.pop(e.rename_from_key, None)
+                with self._index_lock:
+                    old_pid = self.key_to_page.get(e.rename_from_key)
+                    if old_pid and e.key not in self.key_to_page:
+                        self.key_to_page[e.key] = old_pid
+
+            page_id = self._unchanged_page(e.key, e.parent_id, e.content_sha, check_links=conv is not self.conv_plain)
+            if page_id is not None:
+                self._count("not converted")
+            else:
+                res = self._convert(conv, e.md_text, e.current_path)
+                meta = self._source_meta(e.content_sha, self._plain(e.md_text, e.current_path), e.current_path, conv)
+                page_id = self.ensure_page(
+                    key=e.key,
+                    title=e.title,
+                    parent_id=e.parent_id,
+                    storage=res.storage,
+                    extra_labels=["md"],
+                    page_labels=extract_tag_labels(res.front_matter),
+                    collision_prefix=e.collision_prefix,
+                    source_meta=meta,
+                    storage_hash=res.digest,
+                )
+            with self._index_lock:
+                # Ключ именно такой, как формирует _link_resolver (normpath+unquote)
+                self.path_to_page[e.current_path] = page_id
+
+                # Clean up rename artifacts in in-memory indexes
+                if e.rename_from_path:
+                    self.path_to_page.pop(e.rename_from_path, None)
+                if e.rename_from_key and e.rename_from_key != e.key:
+                    if self.key_to_page.get(e.rename_from_key) == page_id:
+                        self.key_to_page.pop(e.rename_from_key, None)
             return page_id
 
+        # Страницы публикуются параллельно (всё упирается в RTT до Confluence),
+        # но страницы одного раздела (parent_id) — последовательно в одном
+        # потоке, чтобы не конфликтовать на общем родителе. parallel: 1 — как раньше.
+        workers = max(1, int(self.cfg.options.get("parallel", 8)))
+        by_parent: dict[str, list[Entry]] = {}
+        for e in entries:
+            by_parent.setdefault(e.parent_id, []).append(e)
+
+        def publish_group(group: list[Entry], conv: MdToConfluenceStorage) -> None:
+            for e in group:
+                publish_entry(e, conv)
+
+        def publish_entries(conv: MdToConfluenceStorage) -> None:
+            if workers == 1 or len(by_parent) <= 1:
+                for e in entries:
+                    publish_entry(e, conv)
+                return
+            with ThreadPoolExecutor(max_workers=min(workers, len(by_parent))) as ex:
+                futures = [ex.submit(publish_group, group, conv) for group in by_parent.values()]
+                for fut in futures:
+                    fut.result()
+
+        # неизменные (по content_sha и т.п.) страницы в Phase A не конвертируются;
+        # если им понадобится Phase B — сконвертируются по ходу
+        self._preconvert([
+            e for e in entries
+            if self._unchanged_page(e.key, e.parent_id, e.content_sha, check_links=False) is None
+        ])
+
         if pass_no == 1:
-            for e in entries:
-                publish_entry(e, self.conv_plain)
-            mode = "changed" if paths_file else "all"
-            print(f"pass {pass_no} ({mode}): published {len(entries)} pages")
+            publish_entries(self.conv_plain)
+            mode = "changed" if changes is not None else "all"
+            print(f"pass {pass_no} ({mode}): published {len(entries)} pages ({self._stats_summary()})")
             return
 
         # PASS2 делаем детерминированно за 1 запуск:
@@ -844,33 +1505,23 @@ class DocsPublisher:
         #  B) второй проход: переписывание md-ссылок и update body
 
         # Phase A
-        for e in entries:
-            publish_entry(e, self.conv_plain)
+        publish_entries(self.conv_plain)
 
         # Phase B
-        conv_links = MdToConfluenceStorage(
-            link_resolver=self._link_resolver,
-            inject_toc=bool(self.cfg.options.get("toc", True)),
-            toc_min_level=int(self.cfg.options.get("toc_min", 1)),
-            toc_max_level=int(self.cfg.options.get("toc_max", 3)),
-            toc_style=str(self.cfg.options.get("toc_style", "none")),
-            toc_outline=bool(self.cfg.options.get("toc_outline", False)),
-            strip_title_h1=True,
-            promote_headings=True,
-            strip_heading_numbers=True,
-            heading_numbering_in_text=bool(self.cfg.options.get("heading_numbering", True)),
-            heading_numbering_css=False,
-            heading_numbering_max_level=int(self.cfg.options.get("heading_numbering_max_level", 3)),
-        )
-
-        for e in entries:
-            publish_entry(e, conv_links)
+        publish_entries(self.conv_pass2)
 
-        mode = "changed" if paths_file else "all"
-        print(f"pass {pass_no} ({mode}): published {len(entries)} pages")
+        mode = "changed" if changes is not None else "all"
+        print(f"pass {pass_no} ({mode}): published {len(entries)} pages ({self._stats_summary()})")
 
     def publish_file(self, md_path: Path, pass_no: int) -> None:
         """Публикует один файл. Для корректного переписывания ссылок (pass2) лучше гонять publish_docs.py."""
+        try:
+            with self._meta_requests():
+                self._publish_file(md_path, pass_no)
+        finally:
+            self.save_bootstrap_cache()
+
+    def _publish_file(self, md_path: Path, pass_no: int) -> None:
         self.bootstrap_existing()
         section_pages = self.ensure_domain_and_sections()
 
@@ -884,53 +1535,57 @@ class DocsPublisher:
         if len(uparts) < 3:
             raise SystemExit(f"Expected docs/<domain>/<section>/...: {md_path}")
         domain, section = uparts[0], uparts[1]
-        if (domain, section) not in section_pages:
+        parent_id = section_pages.get((domain, section))
+        if parent_id is None:
             raise SystemExit(f"Unknown domain/section: {domain}/{section}")
 
-        if pass_no == 1:
-            conv = self.conv_plain
-        else:
-            conv = MdToConfluenceStorage(
-                link_resolver=self._link_resolver,
-                inject_toc=bool(self.cfg.options.get("toc", True)),
-                toc_min_level=int(self.cfg.options.get("toc_min", 1)),
-                toc_max_level=int(self.cfg.options.get("toc_max", 3)),
-                toc_style=str(self.cfg.options.get("toc_style", "none")),
-                toc_outline=bool(self.cfg.options.get("toc_outline", False)),
-                strip_title_h1=True,
-                promote_headings=True,
-                strip_heading_numbers=True,
-                heading_numbering_in_text=bool(self.cfg.options.get("heading_numbering", True)),
-                heading_numbering_css=False,
-                heading_numbering_max_level=int(self.cfg.options.get("heading_numbering_max_level", 3)),
-            )
+        conv = self.conv_plain if pass_no == 1 else self.conv_pass2
 
-        parent_id = section_pages[(domain, section)]
         md_text = md_path.read_text(encoding="utf-8")
         title = guess_title(md_text, fallback=md_path.stem)
-        key = f"file:{_norm_posix(str(md_path))}"
-        res = conv.convert(md_text, current_path=_norm_posix(str(md_path)))
-
-        page_id = self.ensure_page(
-            key=key,
-            title=title,
-            parent_id=str(parent_id),
-            storage=res.storage,
-            extra_labels=["md"],
-            page_labels=extract_tag_labels(res.front_matter),
-            collision_prefix=(self.cfg.domain_title_map.get(domain) or _humanize(domain)),
-        )
-        self.path_to_page[_norm_posix(str(md_path))] = page_id
-        print(f"pass {pass_no}: published 1 page")
-
+        rel = _norm_posix(str(md_path))
+        key = f"file:{rel}"
+        content_sha = converter_cache.content_hash(md_text.encode("utf-8"))
 
-def publish_all(pass_no: int, cfg_path: str = "publish.yml", paths_file: str | None = None) -> None:
+        page_id = self._unchanged_page(key, str(parent_id), content_sha, check_links=conv is not self.conv_plain)
+        if page_id is not None:
+            self._count("not converted")
+        else:
+            res = self._convert(conv, md_text, rel)
+            meta = self._source_meta(content_sha, self._plain(md_text, rel), rel, conv)
+            page_id = self.ensure_page(
+                key=key,
+                title=title,
+                parent_id=str(parent_id),
+                storage=res.storage,
+                extra_labels=["md"],
+                page_labels=extract_tag_labels(res.front_matter),
+                collision_prefix=(self.cfg.domain_title_map.get(domain) or _humanize(domain)),
+                source_meta=meta,
+                storage_hash=res.digest,
+            )
+        self.path_to_page[rel] = page_id
+        print(f"pass {pass_no}: published 1 page ({self._stats_summary()})")
+
+
+def publish_all(
+    pass_no: int,
+    cfg_path: str = "publish.yml",
+    paths_file: str | None = None,
+    *,
+    clean_cache: bool = False,
+    no_bootstrap_cache: bool = False,
+) -> None:
     token = os.getenv("CONF_TOKEN")
     if not token:
         raise SystemExit("Set CONF_TOKEN env var")
 
     cfg = load_cfg(cfg_path)
     pub = DocsPublisher(cfg, token)
+    if clean_cache:
+        pub.clean_convert_cache()
+    if no_bootstrap_cache:
+        pub.drop_bootstrap_cache()
     pub.publish_all(pass_no, paths_file=Path(paths_file) if paths_file else None)
 
 
@@ -943,6 +1598,18 @@ if __name__ == "__main__":
         default=None,
         help="Optional file with changed paths (MR mode). Supports lines: '<path>', 'A <path>', 'M <path>', 'D <path>', 'R <old> <new>', 'R100 <old> <new>'.",
     )
+    ap.add_argument("--clean-cache", action="store_true", help="Drop the on-disk conversion cache before publishing.")
+    ap.add_argument(
+        "--no-bootstrap-cache",
+        action="store_true",
+        help="Ignore the saved page index snapshot and list all pages under the root again.",
+    )
     args = ap.parse_args()
 
-    publish_all(args.pass_no, cfg_path=args.cfg, paths_file=args.paths_file)
+    publish_all(
+        args.pass_no,
+        cfg_path=args.cfg,
+        paths_file=args.paths_file,
+        clean_cache=args.clean_cache,
+        no_bootstrap_cache=args.no_bootstrap_cache,
+    )
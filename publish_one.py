@@ -5,13 +5,17 @@ from pathlib import Path
 from publish_docs import load_cfg, DocsPublisher
 
 
-def main(md_path: str, pass_no: int, cfg_path: str) -> None:
+def main(md_path: str, pass_no: int, cfg_path: str, clean_cache: bool = False, no_bootstrap_cache: bool = False) -> None:
     token = os.getenv("CONF_TOKEN")
     if not token:
         raise SystemExit("Set CONF_TOKEN env var")
 
     cfg = load_cfg(cfg_path)
     pub = DocsPublisher(cfg, token)
+    if clean_cache:
+        pub.clean_convert_cache()
+    if no_bootstrap_cache:
+        pub.drop_bootstrap_cache()
     p = Path(md_path)
     if not p.exists():
         raise SystemExit(f"File not found: {md_path}")
@@ -23,6 +27,12 @@ if __name__ == "__main__":
     ap.add_argument("md_path")
     ap.add_argument("--pass", dest="pass_no", type=int, choices=[1, 2], default=1)
     ap.add_argument("--cfg", default="publish.yml")
+    ap.add_argument("--clean-cache", action="store_true", help="Drop the on-disk conversion cache before publishing.")
+    ap.add_argument(
+        "--no-bootstrap-cache",
+        action="store_true",
+        help="Ignore the saved page index snapshot and list all pages under the root again.",
+    )
     args = ap.parse_args()
 
-    main(args.md_path, args.pass_no, args.cfg)
+    main(args.md_path, args.pass_no, args.cfg, clean_cache=args.clean_cache, no_bootstrap_cache=args.no_bootstrap_cache)
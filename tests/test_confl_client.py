@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import gzip
+import json
+
+import pytest
+
+import confl_client
+from confl_client import Confluence
+
+
+class FakeResponse:
+    def __init__(self, status_code: int = 200, payload: object | None = None, headers: dict | None = None) -> None:
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._payload = payload if payload is not None else {}
+        self.text = json.dumps(self._payload)
+        self.content = self.text.encode("utf-8")
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """Records HTTP calls and replays queued responses per method."""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, str, dict]] = []
+        self.queue: dict[str, list[FakeResponse]] = {}
+
+    def push(self, method: str, resp: FakeResponse) -> None:
+        self.queue.setdefault(method, []).append(resp)
+
+    def _do(self, method: str, url: str, **kw):
+        self.calls.append((method, url, kw))
+        q = self.queue.get(method) or []
+        return q.pop(0) if q else FakeResponse(200, {})
+
+    def request(self, method, url, **kw):
+        return self._do(method.upper(), url, **kw)
+
+    def get(self, url, **kw):
+        return self._do("GET", url, **kw)
+
+    def post(self, url, **kw):
+        return self._do("POST", url, **kw)
+
+    def put(self, url, **kw):
+        return self._do("PUT", url, **kw)
+
+    def delete(self, url, **kw):
+        return self._do("DELETE", url, **kw)
+
+
+def _mk_client() -> tuple[Confluence, FakeSession]:
+    conf = Confluence("http://conf.local", "t")
+    fake = FakeSession()
+    conf.s = fake  # type: ignore
+    return conf, fake
+
+
+def _methods(fake: FakeSession) -> list[str]:
+    return [m for m, _u, _kw in fake.calls]
+
+
+def test_update_page_uses_cached_version_without_get() -> None:
+    conf, fake = _mk_client()
+    conf.prime_versions([{"id": "1", "version": {"number": 4}}])
+    fake.push("PUT", FakeResponse(200, {"id": "1", "version": {"number": 5}}))
+
+    conf.update_page("1", "DOC", "100", "T", "<p>x</p>")
+    conf.update_page("1", "DOC", "100", "T", "<p>y</p>")
+
+    assert _methods(fake) == ["PUT", "PUT"]
+
+
+def test_update_page_refetches_version_on_conflict() -> None:
+    conf, fake = _mk_client()
+    conf.prime_versions([{"id": "1", "version": {"number": 4}}])
+    fake.push("PUT", FakeResponse(409, {"message": "version conflict"}))
+    fake.push("GET", FakeResponse(200, {"id": "1", "version": {"number": 9}}))
+    fake.push("PUT", FakeResponse(200, {"id": "1", "version": {"number": 10}}))
+
+    conf.update_page("1", "DOC", "100", "T", "<p>x</p>")
+
+    assert _methods(fake) == ["PUT", "GET", "PUT"]
+    assert conf._versions["1"] == 10
+
+
+def test_update_page_conflict_after_committed_put_does_not_put_again() -> None:
+    # PUT закоммитился, ответ 504, повтор с той же версией — 409
+    conf, fake = _mk_client()
+    conf.prime_versions([{"id": "1", "version": {"number": 4}}])
+    fake.push("PUT", FakeResponse(409, {"message": "version conflict"}))
+    fake.push("GET", FakeResponse(200, {
+        "id": "1",
+        "title": "T",
+        "version": {"number": 5},
+        "ancestors": [{"id": "1"}, {"id": "100"}],
+        "body": {"storage": {"value": "<p>x</p>", "representation": "storage"}},
+    }))
+
+    out = conf.update_page("1", "DOC", "100", "T", "<p>x</p>")
+
+    assert _methods(fake) == ["PUT", "GET"]
+    assert "body.storage" in fake.calls[1][1]
+    assert out["version"]["number"] == 5 and conf._versions["1"] == 5
+
+
+def test_cql_iter_paginates_until_short_page() -> None:
+    conf, fake = _mk_client()
+    fake.push("GET", FakeResponse(200, {"results": [{"id": "1"}, {"id": "2"}]}))
+    fake.push("GET", FakeResponse(200, {"results": [{"id": "3"}]}))
+
+    ids = [p["id"] for p in conf.cql_iter("type=page", limit=2)]
+
+    assert ids == ["1", "2", "3"]
+    assert [kw["params"]["start"] for _m, _u, kw in fake.calls] == [0, 2]
+
+
+def test_put_property_uses_version_from_get_property() -> None:
+    conf, fake = _mk_client()
+    fake.push("GET", FakeResponse(200, {"key": "k", "value": {}, "version": {"number": 3}}))
+    fake.push("PUT", FakeResponse(200, {"key": "k", "value": {"a": 1}, "version": {"number": 4}}))
+    fake.push("PUT", FakeResponse(200, {"key": "k", "value": {"a": 2}, "version": {"number": 5}}))
+
+    conf.get_property("1", "k")
+    conf.put_property("1", "k", {"a": 1})
+    conf.put_property("1", "k", {"a": 2})
+
+    assert _methods(fake) == ["GET", "PUT", "PUT"]
+    assert json.loads(fake.calls[2][2]["data"])["version"] == {"number": 5}
+
+
+def test_put_property_on_created_page_posts_directly() -> None:
+    conf, fake = _mk_client()
+    fake.push("POST", FakeResponse(200, {"id": "9", "version": {"number": 1}}))
+    fake.push("POST", FakeResponse(200, {"key": "k", "value": {}, "version": {"number": 1}}))
+
+    conf.create_page("DOC", "100", "T", "<p>x</p>")
+    conf.put_property("9", "k", {})
+
+    assert _methods(fake) == ["POST", "POST"]
+
+
+def test_put_property_unknown_falls_back_to_get_then_post() -> None:
+    conf, fake = _mk_client()
+    fake.push("GET", FakeResponse(404, {}))
+    fake.push("POST", FakeResponse(200, {"key": "k", "value": {}, "version": {"number": 1}}))
+
+    conf.put_property("1", "k", {})
+
+    assert _methods(fake) == ["GET", "POST"]
+    assert conf._prop_versions[("1", "k")] == 1
+
+
+def test_large_bodies_are_gzipped_until_server_rejects_them() -> None:
+    conf, fake = _mk_client()
+    conf.gzip_requests = True
+    big = "<p>" + "x" * 10000 + "</p>"
+    fake.push("POST", FakeResponse(200, {"id": "1", "version": {"number": 1}}))
+    fake.push("PUT", FakeResponse(415, {}))
+    fake.push("PUT", FakeResponse(200, {"id": "1", "version": {"number": 2}}))
+
+    conf.create_page("DOC", "100", "T", big)
+    conf.update_page("1", "DOC", "100", "T", big)
+
+    post_kw = fake.calls[0][2]
+    assert post_kw["headers"] == {"Content-Encoding": "gzip"}
+    assert json.loads(gzip.decompress(post_kw["data"]))["body"]["storage"]["value"] == big
+    assert _methods(fake) == ["POST", "PUT", "PUT"]
+    assert "headers" not in fake.calls[2][2]
+    assert conf.gzip_requests is False
+
+
+def test_gzip_is_dropped_when_server_answers_400_to_compressed_body() -> None:
+    conf, fake = _mk_client()
+    conf.gzip_requests = True
+    big = "<p>" + "x" * 10000 + "</p>"
+    fake.push("POST", FakeResponse(400, {"message": "Unexpected character"}))
+    fake.push("POST", FakeResponse(200, {"id": "1", "version": {"number": 1}}))
+    fake.push("POST", FakeResponse(200, {"id": "2", "version": {"number": 1}}))
+
+    conf.create_page("DOC", "100", "T", big)
+    conf.create_page("DOC", "100", "T2", big)
+
+    assert _methods(fake) == ["POST", "POST", "POST"]
+    assert fake.calls[0][2]["headers"] == {"Content-Encoding": "gzip"}
+    assert "headers" not in fake.calls[1][2] and "headers" not in fake.calls[2][2]
+    assert conf.gzip_requests is False
+
+
+def test_genuine_400_keeps_gzip_enabled() -> None:
+    conf, fake = _mk_client()
+    conf.gzip_requests = True
+    big = "<p>" + "x" * 10000 + "</p>"
+    fake.push("POST", FakeResponse(400, {"message": "bad parent"}))
+    fake.push("POST", FakeResponse(400, {"message": "bad parent"}))
+
+    with pytest.raises(RuntimeError, match="Create page failed: 400"):
+        conf.create_page("DOC", "100", "T", big)
+
+    assert _methods(fake) == ["POST", "POST"]
+    assert conf.gzip_requests is True
+
+
+def test_bulk_properties_reads_expanded_property_per_chunk() -> None:
+    conf, fake = _mk_client()
+    prop = {"key": "k", "value": {"key": "file:a.md"}, "version": {"number": 2}}
+    fake.push("GET", FakeResponse(200, {"results": [
+        {"id": "1", "metadata": {"properties": {"k": prop}}},
+        {"id": "2", "metadata": {"properties": {}}},
+    ]}))
+    fake.push("GET", FakeResponse(200, {"results": [{"id": "3", "metadata": {"properties": {"k": prop}}}]}))
+
+    out = conf.bulk_properties(["1", "2", "3"], "k", chunk_size=2)
+
+    assert out == {"1": {"key": "file:a.md"}, "3": {"key": "file:a.md"}}
+    assert [kw["params"]["cql"] for _m, _u, kw in fake.calls] == ["id in (1,2)", "id in (3)"]
+    assert fake.calls[0][2]["params"]["expand"] == "metadata.properties.k"
+    assert conf._prop_versions[("1", "k")] == 2
+
+
+def test_delete_labels_reports_failures_per_label() -> None:
+    conf, fake = _mk_client()
+    fake.push("DELETE", FakeResponse(204, {}))
+    fake.push("DELETE", FakeResponse(500, {}))
+
+    failed = conf.delete_labels("1", ["md", "md", "dir"], workers=1)
+
+    assert [kw["params"]["name"] for _m, _u, kw in fake.calls] == ["md", "dir"]
+    assert list(failed) == ["dir"]
+
+
+class FailingDeleteSession(FakeSession):
+    """DELETE /content/<id> answers 500 for ids in `fail_ids`, 204 otherwise (any order)."""
+
+    def __init__(self, fail_ids: set[str]) -> None:
+        super().__init__()
+        self.fail_ids = fail_ids
+
+    def delete(self, url, **kw):
+        self.calls.append(("DELETE", url, kw))
+        return FakeResponse(500 if url.rsplit("/", 1)[-1] in self.fail_ids else 204, {})
+
+
+def test_delete_pages_reports_failures_and_deletes_the_rest() -> None:
+    conf = Confluence("http://conf.local", "t")
+    fake = FailingDeleteSession({"3", "5"})
+    conf.s = fake  # type: ignore
+
+    failed = conf.delete_pages(["1", "2", "3", "4", "5", "6"], workers=3, chunk_size=2)
+
+    assert sorted(u.rsplit("/", 1)[-1] for _m, u, _kw in fake.calls) == ["1", "2", "3", "4", "5", "6"]
+    assert sorted(failed) == ["3", "5"]
+    assert all(isinstance(e, RuntimeError) for e in failed.values())
+
+
+def test_cleanup_managed_reports_every_failure_before_raising(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    from pathlib import Path
+
+    import cleanup_managed
+    from publish_docs import Cfg
+
+    fake = FailingDeleteSession({"2", "3"})
+    fake.push("GET", FakeResponse(200, {"results": [{"id": i, "title": f"T{i}"} for i in ("1", "2", "3")]}))
+
+    def make_client(*args, **kwargs) -> Confluence:
+        conf = Confluence(*args, **kwargs)
+        conf.s = fake  # type: ignore
+        return conf
+
+    cfg = Cfg(
+        base_url="http://conf.local", space="DOC", docs_root_id="100", docs_dir=Path("docs"),
+        domain_title_map={}, section_title_map={}, options={},
+    )
+    monkeypatch.setenv("CONF_TOKEN", "t")
+    monkeypatch.setattr(cleanup_managed, "load_cfg", lambda _path: cfg)
+    monkeypatch.setattr(cleanup_managed, "Confluence", make_client)
+
+    with pytest.raises(RuntimeError):
+        cleanup_managed.main("publish.yml", delete=True, list_only=False, workers=4)
+
+    out = capsys.readouterr().out
+    assert "delete failed: 2\tT2" in out and "delete failed: 3\tT3" in out
+    assert "Deleted." not in out
+    assert sorted(u.rsplit("/", 1)[-1] for m, u, _kw in fake.calls if m == "DELETE") == ["1", "2", "3"]
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_page_body_is_sent_as_compact_utf8_json(use_orjson: bool, monkeypatch: pytest.MonkeyPatch) -> None:
+    if not use_orjson:
+        monkeypatch.setattr(confl_client, "orjson", None)
+    conf, fake = _mk_client()
+    fake.push("POST", FakeResponse(200, {"id": "1", "version": {"number": 1}}))
+
+    conf.create_page("DOC", "100", "Т", "<p>Привет</p>")
+
+    body = fake.calls[0][2]["data"]
+    assert "<p>Привет</p>".encode("utf-8") in body
+    assert b"\\u" not in body and b", " not in body
+    assert json.loads(body)["body"]["storage"]["value"] == "<p>Привет</p>"
+
+
+def test_property_and_label_payloads_go_through_dumps(monkeypatch: pytest.MonkeyPatch) -> None:
+    encoded: list[object] = []
+    real_dumps = confl_client._dumps
+
+    def spy(obj):
+        encoded.append(obj)
+        return real_dumps(obj)
+
+    monkeypatch.setattr(confl_client, "_dumps", spy)
+    conf, fake = _mk_client()
+    fake.push("GET", FakeResponse(404, {}))
+    fake.push("POST", FakeResponse(200, {"key": "k", "value": {}, "version": {"number": 1}}))
+
+    conf.put_property("1", "k", {"a": "б"})
+    conf.add_labels("1", ["Docs"])
+
+    assert encoded == [{"key": "k", "value": {"a": "б"}}, [{"prefix": "global", "name": "docs"}]]
+    assert all("json" not in kw for _m, _u, kw in fake.calls)
+
+
+def test_post_is_not_retried_by_urllib3() -> None:
+    conf = Confluence("http://conf.local", "t")
+    retry = conf.s.get_adapter("https://conf.local").max_retries
+
+    assert "POST" not in retry.allowed_methods
+    assert {"GET", "PUT", "DELETE"} <= set(retry.allowed_methods)
+
+
+def test_post_is_retried_on_429_only(monkeypatch: pytest.MonkeyPatch) -> None:
+    sleeps: list[float] = []
+    monkeypatch.setattr(confl_client.time, "sleep", sleeps.append)
+    conf, fake = _mk_client()
+    fake.push("POST", FakeResponse(429, {}, headers={"Retry-After": "2"}))
+    fake.push("POST", FakeResponse(200, {"id": "1", "version": {"number": 1}}))
+    fake.push("POST", FakeResponse(502, {}))
+
+    conf.create_page("DOC", "100", "T", "<p>x</p>")
+    with pytest.raises(RuntimeError):
+        conf.create_page("DOC", "100", "T2", "<p>x</p>")
+
+    assert _methods(fake) == ["POST", "POST", "POST"]
+    assert sleeps == [2.0]
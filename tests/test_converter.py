@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import re
 
-from converter.md_to_confluence_storage import MdToConfluenceStorage, strip_front_matter
+from converter.md_to_confluence_storage import MdToConfluenceStorage, storage_digest, strip_front_matter
 
 
 def test_strip_front_matter_extracts_yaml_and_body() -> None:
@@ -151,3 +151,75 @@ Text
 
     # H3 promoted to H2 and numbered (1.1.)
     assert re.search(r"<h2>1\.1\. Second</h2>", res.storage)
+
+
+def test_converter_indented_code_and_linked_image() -> None:
+    conv = MdToConfluenceStorage()
+    md = """\
+    indented <code>
+
+[![logo](img/logo.png)](other.md)
+"""
+    res = conv.convert(md)
+    assert "<pre>" not in res.storage
+    assert "<![CDATA[indented <code>\n]]>" in res.storage
+    assert "ac:name=\"language\"" not in res.storage
+    assert '<a href="other.md" data-source-href="other.md"><ac:image ac:alt="logo">' in res.storage
+    assert res.attachments == {"logo.png"}
+
+
+def test_converters_share_markdown_parser() -> None:
+    a = MdToConfluenceStorage(code_theme="A")
+    b = MdToConfluenceStorage(code_theme="B")
+    assert a.md is b.md
+    # per-instance options still apply although the parser is shared
+    assert ">A<" in a.convert("```\nx\n```\n").storage
+    assert ">B<" in b.convert("```\nx\n```\n").storage
+
+
+def test_conversion_digest_is_stable_and_tagged() -> None:
+    conv = MdToConfluenceStorage()
+    a = conv.convert("Text\n")
+    b = conv.convert("Text\n")
+    c = conv.convert("Other\n")
+    assert a.digest.startswith("blake2b:")
+    assert a.digest == b.digest != c.digest
+    assert a.sha256 == a.digest
+
+
+def test_tasklist_markdown_fallback() -> None:
+    conv = MdToConfluenceStorage()
+    body = "- [x] done\n* [ ] todo\n- [ x ] spaced\nplain [link](a.md)\n"
+    assert conv._tasklists_md_to_unicode(body) == "- ☑ done\n* ☐ todo\n- ☑ spaced\nplain [link](a.md)\n"
+    assert conv._tasklists_md_to_unicode("no tasks\n") == "no tasks\n"
+
+
+def test_converter_builds_only_enabled_steps() -> None:
+    conv = MdToConfluenceStorage(
+        strip_title_h1=False,
+        promote_headings=False,
+        strip_heading_numbers=False,
+        heading_numbering_in_text=False,
+    )
+    assert conv._normalize_markdown not in conv._body_steps
+    assert conv._content_steps == []
+
+    conv = MdToConfluenceStorage(heading_numbering_css=True)
+    assert conv._body_steps[0] == conv._normalize_markdown
+    assert conv._content_steps == [conv._inject_heading_numbering_css]
+
+
+def test_resolve_marked_links_matches_convert_with_resolver() -> None:
+    def resolver(href: str, _cur: str | None) -> str | None:
+        return None if href.startswith("missing") else f"/pages/viewpage.action?pageId=1&h={href}"
+
+    md = '# T\n\nsee [a](a.md "t") [m](missing.md) [e](https://e/x.md) [amp](a&amp;b.md#f)\n'
+    plain = MdToConfluenceStorage()
+    linked = MdToConfluenceStorage(link_resolver=resolver)
+
+    expected = linked.convert(md, current_path="docs/d/s/p.md")
+    got = linked.resolve_marked_links(plain.convert(md, current_path="docs/d/s/p.md"), current_path="docs/d/s/p.md")
+
+    assert got.storage == expected.storage
+    assert got.digest == expected.digest == storage_digest(got.storage)
+    assert 'data-source-href="missing.md"' in got.storage
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import datetime
+import pickle
+from pathlib import Path
+
+import converter_cache
+from converter.md_to_confluence_storage import ConversionResult, MdToConfluenceStorage
+
+
+class CountingConverter(MdToConfluenceStorage):
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    def convert(self, md_text, *, current_path=None):
+        self.calls += 1
+        return super().convert(md_text, current_path=current_path)
+
+
+def test_convert_cached_hits_on_second_call(tmp_path: Path) -> None:
+    conv = CountingConverter()
+    fp = converter_cache.options_fingerprint({"toc_style": "default"})
+
+    first = converter_cache.convert_cached(conv, "# A\n\ntext\n", "docs/a.md", fp, cache_dir=tmp_path)
+    second = converter_cache.convert_cached(conv, "# A\n\ntext\n", "docs/a.md", fp, cache_dir=tmp_path)
+
+    assert conv.calls == 1
+    assert second.storage == first.storage
+    assert second.digest == first.digest
+
+
+def test_convert_cached_misses_on_changed_text_path_or_options(tmp_path: Path) -> None:
+    conv = CountingConverter()
+    fp = converter_cache.options_fingerprint({"toc_style": "default"})
+    other_fp = converter_cache.options_fingerprint({"toc_style": "none"})
+
+    converter_cache.convert_cached(conv, "# A\n", "docs/a.md", fp, cache_dir=tmp_path)
+    converter_cache.convert_cached(conv, "# B\n", "docs/a.md", fp, cache_dir=tmp_path)
+    converter_cache.convert_cached(conv, "# A\n", "docs/b.md", fp, cache_dir=tmp_path)
+    converter_cache.convert_cached(conv, "# A\n", "docs/a.md", other_fp, cache_dir=tmp_path)
+
+    assert conv.calls == 4
+
+
+def test_corrupt_entry_is_recomputed(tmp_path: Path) -> None:
+    conv = CountingConverter()
+    fp = converter_cache.options_fingerprint({})
+    key = converter_cache.cache_key("plain text\n", "docs/a.md", fp)
+    entry = tmp_path / key[:2] / f"{key}.json"
+    entry.parent.mkdir(parents=True)
+    entry.write_bytes(b"not json")
+
+    res = converter_cache.convert_cached(conv, "plain text\n", "docs/a.md", fp, cache_dir=tmp_path)
+
+    assert conv.calls == 1
+    assert "plain text" in res.storage
+
+
+def test_content_hash_is_128_bit_and_separates_parts() -> None:
+    h = converter_cache.content_hash(b"a", b"b")
+
+    assert len(h) == 32 and int(h, 16) >= 0
+    assert h == converter_cache.content_hash(b"a", b"b")
+    assert h != converter_cache.content_hash(b"ab")
+
+
+def test_entries_are_json_and_pickles_are_never_loaded(tmp_path: Path) -> None:
+    fp = converter_cache.options_fingerprint({})
+    key = converter_cache.cache_key("plain text\n", "docs/a.md", fp)
+    res = ConversionResult(
+        storage="<p>x</p>", front_matter={"tags": ["a"]}, attachments={"b.png", "a.png"}, digest="d"
+    )
+
+    converter_cache.store(tmp_path, key, res)
+
+    assert converter_cache.load(tmp_path, key) == res
+    entry = tmp_path / key[:2] / f"{key}.json"
+    entry.write_bytes(pickle.dumps(res))
+    assert converter_cache.load(tmp_path, key) is None
+
+
+def test_front_matter_that_does_not_round_trip_is_not_cached(tmp_path: Path) -> None:
+    conv = CountingConverter()
+    fp = converter_cache.options_fingerprint({})
+    md = "---\ndate: 2026-10-14\n---\nplain text\n"
+
+    first = converter_cache.convert_cached(conv, md, "docs/a.md", fp, cache_dir=tmp_path)
+    second = converter_cache.convert_cached(conv, md, "docs/a.md", fp, cache_dir=tmp_path)
+
+    assert conv.calls == 2
+    assert second.front_matter["date"] == first.front_matter["date"] == datetime.date(2026, 10, 14)
@@ -5,7 +5,8 @@ from pathlib import Path
 
 import pytest
 
-from publish_docs import DocsPublisher, Cfg, _label_for, PROPERTY_KEY, LEGACY_SRC_LABEL_PREFIX
+import bootstrap_cache
+from publish_docs import DocsPublisher, Cfg, Entry, _label_for, PROPERTY_KEY, LEGACY_SRC_LABEL_PREFIX
 
 
 class FakeConfluence:
@@ -25,6 +26,8 @@ class FakeConfluence:
         self._create_fail_titles: set[str] = set()
         self._update_fail_titles: set[str] = set()
         self._find_by_title: dict[str, dict] = {}
+        self.cql_pages: list[dict] = []
+        self.bulk_calls: list[tuple[list[str], str]] = []
 
     # --- controls ---
     def fail_create_for_title(self, title: str) -> None:
@@ -63,9 +66,24 @@ class FakeConfluence:
     def delete_label(self, page_id: str, label: str) -> None:
         self.deleted_labels.append((str(page_id), str(label)))
 
+    def delete_labels(self, page_id: str, names, *, workers: int = 4) -> dict:
+        for name in names:
+            self.delete_label(page_id, name)
+        return {}
+
     def find_page_by_title(self, space: str, title: str, *, expand: str = "ancestors"):
         return self._find_by_title.get(title)
 
+    def cql_iter(self, cql: str, *, expand: str = "metadata.labels,ancestors", limit: int = 200):
+        return iter(self.cql_pages)
+
+    def prime_versions(self, pages) -> None:
+        pass
+
+    def bulk_properties(self, page_ids, key: str, *, chunk_size: int = 100):
+        self.bulk_calls.append((list(page_ids), key))
+        return {}
+
 
 def _mk_cfg(tmp_path: Path, *, base_url: str = "https://conf.company.ru/wiki") -> Cfg:
     return Cfg(
@@ -75,7 +93,10 @@ def _mk_cfg(tmp_path: Path, *, base_url: str = "https://conf.company.ru/wiki") -
         docs_dir=tmp_path / "docs",
         domain_title_map={},
         section_title_map={},
-        options={"adopt_existing_by_title_under_root": True},
+        options={
+            "adopt_existing_by_title_under_root": True,
+            "convert_cache_dir": str(tmp_path / ".md-publish-cache"),
+        },
     )
 
 
@@ -209,3 +230,537 @@ def test_link_resolver_ignores_non_md_and_external(tmp_path: Path) -> None:
     assert pub._link_resolver("https://example.com/x", current_path="docs/a/c.md") is None
     assert pub._link_resolver("#sec", current_path="docs/a/c.md") is None
     assert pub._link_resolver("file.txt", current_path="docs/a/c.md") is None
+
+
+def test_link_resolver_sees_pages_added_after_first_lookup(tmp_path: Path) -> None:
+    pub = DocsPublisher(_mk_cfg(tmp_path), token="t")
+
+    assert pub._link_resolver("../x/new.md", current_path="docs/a/c.md") is None
+    pub.path_to_page["docs/x/new.md"] = "7"
+    assert pub._link_resolver("../x/new.md", current_path="docs/a/c.md") == "/wiki/pages/viewpage.action?pageId=7"
+
+
+def test_bootstrap_reads_inline_expanded_properties(tmp_path: Path) -> None:
+    cfg = _mk_cfg(tmp_path)
+    pub = DocsPublisher(cfg, token="t")
+    fake = FakeConfluence()
+    pub.conf = fake  # type: ignore
+    fake.cql_pages = [
+        {"id": "1", "metadata": {"labels": {"results": []}, "properties": {
+            PROPERTY_KEY: {"key": PROPERTY_KEY, "value": {"key": "file:docs/a.md"}}}}},
+        {"id": "2", "metadata": {"labels": {"results": []}, "properties": {
+            "source": {"key": "source", "value": {"key": "file:docs/b.md"}}}}},
+    ]
+
+    pub.bootstrap_existing()
+
+    assert pub.key_to_page == {"file:docs/a.md": "1", "file:docs/b.md": "2"}
+    assert pub.path_to_page["docs/a.md"] == "1"
+    assert fake.bulk_calls == []
+
+
+def test_convert_reuses_plain_result_for_text_without_md_links(tmp_path: Path) -> None:
+    pub = DocsPublisher(_mk_cfg(tmp_path), token="t")
+    conv_links = pub.conv_pass2
+    assert conv_links.link_resolver is not None
+
+    plain = pub._convert(pub.conv_plain, "# T\n\ntext\n", "docs/d/s/a.md")
+    assert pub._convert(conv_links, "# T\n\ntext\n", "docs/d/s/a.md") is plain
+
+    linked = "# T\n\nsee [b](b.md) and [c](c.md)\n"
+    plain_linked = pub._convert(pub.conv_plain, linked, "docs/d/s/a.md")
+    pub.path_to_page["docs/d/s/b.md"] = "42"
+    resolved = pub._convert(conv_links, linked, "docs/d/s/a.md")
+    assert resolved.storage == conv_links.convert(linked, current_path="docs/d/s/a.md").storage
+    assert 'href="/wiki/pages/viewpage.action?pageId=42"' in resolved.storage
+    assert 'data-source-href="c.md"' in resolved.storage
+    assert resolved.digest != plain_linked.digest
+
+
+def test_preconvert_fills_conversion_cache_from_worker_processes(tmp_path: Path) -> None:
+    cfg = _mk_cfg(tmp_path)
+    cfg.options["convert_workers"] = 2
+    pub = DocsPublisher(cfg, token="t")
+    entries = [
+        Entry(
+            path=tmp_path / f"p{i}.md",
+            current_path=f"docs/d/s/p{i}.md",
+            md_text=f"# P{i}\n\n## 1. Sub\n\nsee [n](p{i + 1}.md)\n",
+            title=f"P{i}",
+            key=f"file:docs/d/s/p{i}.md",
+            parent_id="200",
+            collision_prefix="D",
+        )
+        for i in range(10)
+    ]
+
+    pub._preconvert(entries)
+
+    assert len(pub._conv_cache) == 10
+    for e in entries:
+        expected = pub.conv_plain.convert(e.md_text, current_path=e.current_path)
+        got = pub._convert(pub.conv_plain, e.md_text, e.current_path)
+        assert (got.storage, got.digest) == (expected.storage, expected.digest)
+
+
+def test_ensure_page_skips_unchanged_page(tmp_path: Path) -> None:
+    cfg = _mk_cfg(tmp_path)
+    pub = DocsPublisher(cfg, token="t")
+    fake = FakeConfluence()
+    pub.conf = fake  # type: ignore
+
+    key = "file:docs/a.md"
+    pub.key_to_page[key] = "777"
+    kw = dict(key=key, title="Hello", parent_id="100", extra_labels=["md"], collision_prefix="DOCS")
+
+    pub.ensure_page(storage="<p>x</p>", **kw)
+    pub.ensure_page(storage="<p>x</p>", **kw)
+    assert len(fake.updated) == 1
+    assert [k for _pid, k, _v in fake.props] == [PROPERTY_KEY]
+
+    # new tag -> labels/property are refreshed, the body is still not re-uploaded
+    pub.ensure_page(storage="<p>x</p>", page_labels=["new-tag"], **kw)
+    assert len(fake.updated) == 1
+    assert fake.labeled[-1] == ("777", ["managed-docs", "new-tag"])
+
+    pub.ensure_page(storage="<p>y</p>", **kw)
+    assert len(fake.updated) == 2
+
+
+def test_adopt_by_title_uses_bootstrap_titles(tmp_path: Path) -> None:
+    cfg = _mk_cfg(tmp_path)
+    pub = DocsPublisher(cfg, token="t")
+    fake = FakeConfluence()
+    pub.conf = fake  # type: ignore
+    fake.cql_pages = [{"id": "5", "title": "Hello", "metadata": {"labels": {"results": []}, "properties": {}}}]
+    fake.fail_create_for_title("Hello")
+
+    pub.bootstrap_existing()
+    page_id = pub.ensure_page(
+        key="file:docs/a.md", title="Hello", parent_id="100", storage="<p>x</p>", extra_labels=["md"]
+    )
+
+    # found via the bootstrap title map; find_page_by_title has nothing configured
+    assert page_id == "5"
+    assert fake.updated[0][0] == "5"
+
+
+def test_legacy_source_property_is_written_only_when_enabled(tmp_path: Path) -> None:
+    cfg = _mk_cfg(tmp_path)
+    cfg.options["dual_write_legacy_source_property"] = True
+    pub = DocsPublisher(cfg, token="t")
+    fake = FakeConfluence()
+    pub.conf = fake  # type: ignore
+
+    pub.ensure_page(key="file:docs/a.md", title="Hello", parent_id="100", storage="<p>x</p>", extra_labels=["md"])
+
+    assert [k for _pid, k, _v in fake.props] == [PROPERTY_KEY, "source"]
+
+
+def test_labels_are_only_deleted_when_the_page_has_them(tmp_path: Path) -> None:
+    cfg = _mk_cfg(tmp_path)
+    pub = DocsPublisher(cfg, token="t")
+    fake = FakeConfluence()
+    pub.conf = fake  # type: ignore
+    fake.cql_pages = [
+        {"id": "1", "metadata": {"labels": {"results": [{"name": "managed-docs"}, {"name": "md"}]}, "properties": {
+            PROPERTY_KEY: {"value": {"key": "file:docs/a.md"}}}}},
+        {"id": "2", "metadata": {"labels": {"results": [{"name": "managed-docs"}]}, "properties": {
+            PROPERTY_KEY: {"value": {"key": "file:docs/b.md"}}}}},
+    ]
+
+    pub.bootstrap_existing()
+    assert fake.deleted_labels == [("1", "md")]
+
+    pub.ensure_page(key="file:docs/b.md", title="B", parent_id="100", storage="<p>b</p>", extra_labels=["md"])
+    pub.ensure_page(key="file:docs/c.md", title="C", parent_id="100", storage="<p>c</p>", extra_labels=["md"])
+    assert fake.deleted_labels == [("1", "md")]
+
+
+def test_bootstrap_property_lets_ensure_page_skip_unchanged(tmp_path: Path) -> None:
+    from converter.md_to_confluence_storage import storage_digest
+
+    cfg = _mk_cfg(tmp_path)
+    pub = DocsPublisher(cfg, token="t")
+    fake = FakeConfluence()
+    pub.conf = fake  # type: ignore
+    value = {
+        "key": "file:docs/a.md",
+        "title": "Hello",
+        "meta_labels": ["md"],
+        "body_hash": storage_digest("<p>x</p>"),
+        "parent_id": "100",
+        "page_labels": ["managed-docs"],
+    }
+    fake.cql_pages = [{"id": "1", "metadata": {"labels": {"results": []}, "properties": {PROPERTY_KEY: {"value": value}}}}]
+
+    pub.bootstrap_existing()
+    pub.ensure_page(key="file:docs/a.md", title="Hello", parent_id="100", storage="<p>x</p>", extra_labels=["md"])
+
+    assert fake.updated == [] and fake.props == [] and fake.labeled == []
+
+
+def _bootstrap_pages_from(fake: FakeConfluence) -> list[dict]:
+    # как их вернёт CQL bootstrap следующего прогона: последняя property на страницу
+    last: dict[str, dict] = {}
+    for pid, key, value in fake.props:
+        if key == PROPERTY_KEY:
+            last[pid] = value
+    return [
+        {
+            "id": pid,
+            "title": value["title"],
+            "metadata": {
+                "labels": {"results": [{"name": lb} for lb in value["page_labels"]]},
+                "properties": {PROPERTY_KEY: {"key": PROPERTY_KEY, "value": value}},
+            },
+        }
+        for pid, value in last.items()
+    ]
+
+
+def test_warm_run_skips_conversion_of_unchanged_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    import dataclasses
+
+    monkeypatch.chdir(tmp_path)
+    sec = tmp_path / "docs" / "d" / "s"
+    sec.mkdir(parents=True)
+    (sec / "a.md").write_text("# A\n\nsee [b](b.md)\n", encoding="utf-8")
+    (sec / "b.md").write_text("# B\n\ntext\n", encoding="utf-8")
+    cfg = dataclasses.replace(_mk_cfg(tmp_path), docs_dir=Path("docs"), domain_title_map={"d": "D"})
+
+    first = DocsPublisher(cfg, token="t")
+    fake1 = FakeConfluence()
+    first.conf = fake1  # type: ignore
+    first.publish_all(2)
+
+    second = DocsPublisher(cfg, token="t")
+    fake2 = FakeConfluence()
+    fake2.cql_pages = _bootstrap_pages_from(fake1)
+    second.conf = fake2  # type: ignore
+    converted: list[str] = []
+    real_convert = second._convert
+
+    def counting_convert(conv, md_text, current_path):
+        converted.append(current_path)
+        return real_convert(conv, md_text, current_path)
+
+    monkeypatch.setattr(second, "_convert", counting_convert)
+    second.publish_all(2)
+
+    assert converted == []
+    assert fake2.created == [] and fake2.updated == [] and fake2.props == []
+    assert second.path_to_page == first.path_to_page
+    # 2 файла x (Phase A + Phase B) + страницы домена и раздела
+    assert second.stats == {"not converted": 4, "unchanged": 2}
+
+    # правка файла — конвертируется и публикуется только он
+    (sec / "b.md").write_text("# B\n\nnew text\n", encoding="utf-8")
+    third = DocsPublisher(cfg, token="t")
+    fake3 = FakeConfluence()
+    fake3.cql_pages = _bootstrap_pages_from(fake1)
+    third.conf = fake3  # type: ignore
+    third.publish_all(2)
+
+    assert [u[3] for u in fake3.updated] == ["B"]
+
+
+def test_new_unrelated_page_does_not_invalidate_linking_pages(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    import dataclasses
+
+    monkeypatch.chdir(tmp_path)
+    sec = tmp_path / "docs" / "d" / "s"
+    sec.mkdir(parents=True)
+    (sec / "a.md").write_text("# A\n\nsee [b](b.md)\n", encoding="utf-8")
+    (sec / "b.md").write_text("# B\n\ntext\n", encoding="utf-8")
+    cfg = dataclasses.replace(_mk_cfg(tmp_path), docs_dir=Path("docs"), domain_title_map={"d": "D"})
+
+    first = DocsPublisher(cfg, token="t")
+    fake1 = FakeConfluence()
+    first.conf = fake1  # type: ignore
+    first.publish_all(2)
+
+    # новая страница меняет path_to_page, но не цели ссылок a.md
+    (sec / "c.md").write_text("# C\n\nother\n", encoding="utf-8")
+    second = DocsPublisher(cfg, token="t")
+    fake2 = FakeConfluence()
+    fake2.cql_pages = _bootstrap_pages_from(fake1)
+    second.conf = fake2  # type: ignore
+    converted: list[str] = []
+    real_convert = second._convert
+
+    def counting_convert(conv, md_text, current_path):
+        converted.append(current_path)
+        return real_convert(conv, md_text, current_path)
+
+    monkeypatch.setattr(second, "_convert", counting_convert)
+    second.publish_all(2)
+
+    assert [c[2] for c in fake2.created] == ["C"]
+    assert {Path(p).name for p in converted} == {"c.md"}
+    assert fake2.updated == []
+
+
+class DeltaConfluence(FakeConfluence):
+    """cql_iter that tells apart the id listing, the lastmodified delta and `id in (...)`."""
+
+    def __init__(self, pages: list[dict], *, modified: tuple[str, ...] = ()) -> None:
+        super().__init__()
+        self.cql_pages = pages
+        self.modified = set(modified)
+        self.queries: list[tuple[str, str]] = []
+
+    def cql_iter(self, cql: str, *, expand: str = "metadata.labels,ancestors", limit: int = 200):
+        self.queries.append((cql, expand))
+        if cql.startswith("id in ("):
+            ids = cql[len("id in ("):-1].split(",")
+            return iter([p for p in self.cql_pages if p["id"] in ids])
+        if "lastmodified" in cql:
+            return iter([p for p in self.cql_pages if p["id"] in self.modified])
+        if not expand:
+            return iter([{"id": p["id"], "title": p["title"]} for p in self.cql_pages])
+        return iter(self.cql_pages)
+
+
+def _src_page(page_id: str, rel: str, version: int = 1) -> dict:
+    return {
+        "id": page_id,
+        "title": rel,
+        "version": {"number": version, "when": "2026-10-01T10:00:00.000+03:00"},
+        "metadata": {"labels": {"results": [{"name": "managed-docs"}]}, "properties": {
+            PROPERTY_KEY: {"key": PROPERTY_KEY, "value": {"key": f"file:{rel}"}, "version": {"number": 1}}}},
+    }
+
+
+def test_bootstrap_snapshot_is_refreshed_with_delta_query(tmp_path: Path) -> None:
+    cfg = _mk_cfg(tmp_path)
+    first = DocsPublisher(cfg, token="t")
+    first.conf = DeltaConfluence([_src_page("1", "docs/a.md"), _src_page("2", "docs/b.md")])  # type: ignore
+    first.bootstrap_existing()
+    first.save_bootstrap_cache()
+    assert list((tmp_path / ".md-publish-cache").glob("bootstrap-*.json"))
+
+    # 2 удалили, 1 правили (новый title), 3 — новая страница
+    second = DocsPublisher(cfg, token="t")
+    fake = DeltaConfluence(
+        [_src_page("1", "docs/a2.md", version=2), _src_page("3", "docs/c.md")], modified=("1",)
+    )
+    second.conf = fake  # type: ignore
+    second.bootstrap_existing()
+
+    assert second.key_to_page == {"file:docs/a2.md": "1", "file:docs/c.md": "3"}
+    assert [expand for _cql, expand in fake.queries][0] == ""
+    assert 'lastmodified >= "2026/09/30 07:00"' in fake.queries[1][0]
+    assert fake.queries[2][0] == "id in (3)"
+    assert len(fake.queries) == 3
+
+    # страница, которой прогон менял labels, в снимок не попадает
+    second._ensure_labels("3", ["managed-docs"])
+    second.save_bootstrap_cache()
+    third = DocsPublisher(cfg, token="t")
+    fake3 = DeltaConfluence([_src_page("1", "docs/a2.md", version=2), _src_page("3", "docs/c.md")])
+    third.conf = fake3  # type: ignore
+    third.bootstrap_existing()
+
+    assert third.key_to_page == second.key_to_page
+    assert [cql for cql, _expand in fake3.queries][2] == "id in (3)"
+
+    # --no-bootstrap-cache: полный листинг
+    third.drop_bootstrap_cache()
+    fourth = DocsPublisher(cfg, token="t")
+    fake4 = DeltaConfluence([_src_page("1", "docs/a2.md", version=2)])
+    fourth.conf = fake4  # type: ignore
+    fourth.bootstrap_existing()
+
+    assert len(fake4.queries) == 1 and fake4.queries[0][1].startswith("metadata.labels")
+    assert fourth.key_to_page == {"file:docs/a2.md": "1"}
+
+
+class UniqueTitleConfluence(FakeConfluence):
+    """Титулы уникальны в space, как в Confluence; созданные страницы находятся по title."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.by_title: dict[str, str] = {}
+
+    def create_page(self, space: str, parent_id: str, title: str, storage: str):
+        if title in self.by_title:
+            raise RuntimeError("A page with this title already exists")
+        created = super().create_page(space, parent_id, title, storage)
+        self.by_title[title] = created["id"]
+        return created
+
+    def find_page_by_title(self, space: str, title: str, *, expand: str = "ancestors"):
+        page_id = self.by_title.get(title)
+        return {"id": page_id, "ancestors": [{"id": "100"}]} if page_id else None
+
+
+def test_parallel_sections_never_adopt_pages_created_in_the_same_run(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    import dataclasses
+
+    monkeypatch.chdir(tmp_path)
+    for sec in ("s1", "s2"):
+        (tmp_path / "docs" / "d" / sec).mkdir(parents=True)
+        (tmp_path / "docs" / "d" / sec / "x.md").write_text(f"# Same\n\nfrom {sec}\n", encoding="utf-8")
+    cfg = dataclasses.replace(_mk_cfg(tmp_path), docs_dir=Path("docs"), domain_title_map={"d": "D"})
+    pub = DocsPublisher(cfg, token="t")
+    fake = UniqueTitleConfluence()
+    pub.conf = fake  # type: ignore
+
+    pub.publish_all(1)
+
+    a, b = pub.path_to_page["docs/d/s1/x.md"], pub.path_to_page["docs/d/s2/x.md"]
+    assert a != b
+    assert fake.updated == []
+    assert sorted(t for _s, _p, t, _b in fake.created if "Same" in t) == ["D · Same", "Same"]
+
+
+def test_publish_all_shuts_down_meta_pool(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    import dataclasses
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "docs" / "d" / "s").mkdir(parents=True)
+    (tmp_path / "docs" / "d" / "s" / "a.md").write_text("# A\n\ntext\n", encoding="utf-8")
+    cfg = dataclasses.replace(_mk_cfg(tmp_path), docs_dir=Path("docs"), domain_title_map={"d": "D"})
+    pub = DocsPublisher(cfg, token="t")
+    fake = FakeConfluence()
+    pub.conf = fake  # type: ignore
+    pools = []
+    real_add_labels = fake.add_labels
+
+    def add_labels(page_id, labels):
+        pools.append(pub._meta_pool)
+        real_add_labels(page_id, labels)
+
+    fake.add_labels = add_labels  # type: ignore
+
+    pub.publish_all(1)
+
+    assert pools and all(p is not None for p in pools)
+    assert pub._meta_pool is None
+    assert pools[0]._shutdown
+
+
+def test_paths_file_with_repo_relative_paths_and_absolute_docs_dir(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    import dataclasses
+
+    monkeypatch.chdir(tmp_path)
+    for root in ("docs", "vendor/docs"):
+        (tmp_path / root / "d" / "s").mkdir(parents=True)
+        (tmp_path / root / "d" / "s" / "a.md").write_text("# A\n\ntext\n", encoding="utf-8")
+    (tmp_path / "docs" / "d" / "s" / "b.md").write_text("# B\n\ntext\n", encoding="utf-8")
+    changed = tmp_path / "changed.txt"
+    changed.write_text("M docs/d/s/a.md\nM vendor/docs/d/s/a.md\n", encoding="utf-8")
+    # docs_dir — абсолютный tmp_path/docs
+    cfg = dataclasses.replace(_mk_cfg(tmp_path), domain_title_map={"d": "D"})
+    pub = DocsPublisher(cfg, token="t")
+    fake = FakeConfluence()
+    pub.conf = fake  # type: ignore
+
+    pub.publish_all(1, paths_file=changed)
+
+    # только docs/d/s/a.md, и под тем же ключом, что дал бы полный прогон
+    assert list(pub.path_to_page) == [(tmp_path / "docs" / "d" / "s" / "a.md").as_posix()]
+    assert [c[2] for c in fake.created if c[2] in ("A", "B")] == ["A"]
+
+
+def test_symlinked_doc_outside_docs_dir_is_published(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    import dataclasses
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "docs" / "d" / "s").mkdir(parents=True)
+    (tmp_path / "shared").mkdir()
+    (tmp_path / "shared" / "real.md").write_text("# Linked\n\ntext\n", encoding="utf-8")
+    (tmp_path / "docs" / "d" / "s" / "link.md").symlink_to(tmp_path / "shared" / "real.md")
+    changed = tmp_path / "changed.txt"
+    changed.write_text("M docs/d/s/link.md\n", encoding="utf-8")
+    cfg = dataclasses.replace(_mk_cfg(tmp_path), domain_title_map={"d": "D"})
+
+    for paths_file in (None, changed):
+        pub = DocsPublisher(cfg, token="t")
+        fake = FakeConfluence()
+        pub.conf = fake  # type: ignore
+        pub.publish_all(1, paths_file=paths_file)
+
+        assert list(pub.path_to_page) == [(tmp_path / "docs" / "d" / "s" / "link.md").as_posix()]
+
+
+def test_adopt_by_title_skips_pages_of_other_keys_and_retitled_pages(tmp_path: Path) -> None:
+    cfg = _mk_cfg(tmp_path)
+    pub = DocsPublisher(cfg, token="t")
+    fake = FakeConfluence()
+    pub.conf = fake  # type: ignore
+    fake.cql_pages = [_src_page("1", "docs/a.md"), _src_page("2", "docs/b.md")]
+    fake.cql_pages[0]["title"], fake.cql_pages[1]["title"] = "Alpha", "Beta"
+    pub.bootstrap_existing()
+
+    # a.md переименовали в Gamma: title Alpha в карте больше не указывает на страницу 1
+    pub.ensure_page(key="file:docs/a.md", title="Gamma", parent_id="100", storage="<p>a</p>", extra_labels=["md"])
+    new_alpha = pub.ensure_page(
+        key="file:docs/c.md", title="Alpha", parent_id="100", storage="<p>c</p>", extra_labels=["md"]
+    )
+    # Beta — страница ключа file:docs/b.md, её не усыновляем
+    new_beta = pub.ensure_page(
+        key="file:docs/d.md", title="Beta", parent_id="100", storage="<p>d</p>", extra_labels=["md"]
+    )
+
+    assert new_alpha not in ("1", "2") and new_beta not in ("1", "2")
+    assert [u[0] for u in fake.updated] == ["1"]
+    assert pub.title_to_page_under_root["Gamma"] == "1"
+
+
+def test_interrupted_run_leaves_no_stale_pages_in_bootstrap_snapshot(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    import dataclasses
+
+    monkeypatch.chdir(tmp_path)
+    sec = tmp_path / "docs" / "d" / "s"
+    sec.mkdir(parents=True)
+    (sec / "a.md").write_text("# A\n\nnew\n", encoding="utf-8")
+    (sec / "b.md").write_text("# B\n\nnew\n", encoding="utf-8")
+    cfg = dataclasses.replace(_mk_cfg(tmp_path), docs_dir=Path("docs"), domain_title_map={"d": "D"})
+    cfg.options["parallel"] = 1
+    snapshot = tmp_path / ".md-publish-cache" / bootstrap_cache.file_name(cfg.base_url, cfg.docs_root_id)
+    pages = [_src_page("1", "docs/d/s/a.md"), _src_page("2", "docs/d/s/b.md")]
+
+    first = DocsPublisher(cfg, token="t")
+    first.conf = DeltaConfluence(pages)  # type: ignore
+    first.bootstrap_existing()
+    first.save_bootstrap_cache()
+
+    # прогон падает после записи property страницы 1
+    second = DocsPublisher(cfg, token="t")
+    fake = DeltaConfluence(pages)
+    second.conf = fake  # type: ignore
+    real_put = fake.put_property
+
+    def put_property(page_id, key, value):
+        if page_id == "2":
+            raise RuntimeError("boom")
+        return real_put(page_id, key, value)
+
+    fake.put_property = put_property  # type: ignore
+    real_bootstrap = second.bootstrap_existing
+
+    def bootstrap_and_check():
+        real_bootstrap()
+        # снимок прочитан — на диске его больше нет, пока прогон не закончится
+        assert not snapshot.exists()
+
+    second.bootstrap_existing = bootstrap_and_check  # type: ignore
+    with pytest.raises(RuntimeError, match="boom"):
+        second.publish_all(1)
+
+    assert "1" in {pid for pid, _k, _v in fake.props}
+    third = DocsPublisher(cfg, token="t")
+    fake3 = DeltaConfluence(pages)
+    third.conf = fake3  # type: ignore
+    third.bootstrap_existing()
+
+    # тронутые упавшим прогоном страницы перечитываются, а не берутся из снимка
+    assert fake3.queries[2][0] == "id in (1,2)"
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import os
+import shutil
+import subprocess
 from pathlib import Path
 
 import pytest
 
-from publish_docs import _norm_posix, guess_title, load_cfg, sanitize_label, extract_tag_labels, _parse_paths_file
+from publish_docs import _norm_posix, guess_title, load_cfg, sanitize_label, extract_tag_labels, _parse_paths_file, _git_changes, ConverterOpts
 
 
 def test_norm_posix_handles_windows_paths_and_dotdot() -> None:
@@ -46,6 +48,24 @@ docs_dir: docs
     assert cfg.docs_root_id == "999"
 
 
+def test_load_cfg_fills_empty_titles_and_freezes_cfg(tmp_path: Path) -> None:
+    import dataclasses
+
+    yml = tmp_path / "publish.yml"
+    yml.write_text(
+        "docs_root_id: 1\n"
+        "domain_title_map:\n  shopping-cart:\n  strategy: Стратегия\n"
+        "section_title_map:\n  ADR: ADR\n",
+        encoding="utf-8",
+    )
+
+    cfg = load_cfg(str(yml))
+
+    assert cfg.domain_title_map == {"shopping-cart": "Shopping cart", "strategy": "Стратегия"}
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        cfg.space = "X"  # type: ignore[misc]
+
+
 def test_load_cfg_requires_docs_root_id(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
     yml = tmp_path / "publish.yml"
     yml.write_text("base_url: http://x\nspace: DOC\n", encoding="utf-8")
@@ -63,6 +83,18 @@ def test_sanitize_label_and_extract_tag_labels() -> None:
     assert extract_tag_labels(fm) == ["service", "api", "protocol", "domain-tag"]
 
 
+@pytest.mark.parametrize("raw, expected", [
+    ("api", "api"),
+    ("--a__b  c--", "a-b-c"),
+    ("v1.2/x", "v1-2-x"),
+    ("---", None),
+    ("Ядро_API", "api"),
+    ("über tag", "ber-tag"),
+])
+def test_sanitize_label_ascii_fast_path_matches_regex(raw: str, expected: str | None) -> None:
+    assert sanitize_label(raw) == expected
+
+
 def test_parse_paths_file_supports_plain_and_status_lines(tmp_path: Path) -> None:
     docs_dir = tmp_path / "docs"
     docs_dir.mkdir()
@@ -77,12 +109,84 @@ A docs/e/f.md
 D docs/g/h.md
 R docs/old.md docs/new.md
 R100 docs/old2.md docs/new2.md
+M vendor/docs/x.md
 """.strip(),
         encoding="utf-8",
     )
 
-    changes = _parse_paths_file(f, docs_dir)
+    changes = _parse_paths_file(f, docs_dir, root=tmp_path)
     # D is kept as a change record (publisher ignores it later)
     assert [c.op for c in changes] == ["M", "M", "A", "D", "R", "R"]
     assert changes[0].path == "docs/a/b.md"
     assert changes[4].path == "docs/old.md" and changes[4].new_path == "docs/new.md"
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_git_changes_reads_name_status_since_base(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def git(*args: str) -> None:
+        subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t", *args], cwd=tmp_path, check=True, capture_output=True)
+
+    (tmp_path / "docs" / "d" / "s").mkdir(parents=True)
+    (tmp_path / "docs" / "d" / "s" / "old.md").write_text("# Old\n", encoding="utf-8")
+    (tmp_path / "docs" / "d" / "s" / "keep.md").write_text("# Keep\n", encoding="utf-8")
+    git("init", "-q")
+    git("add", ".")
+    git("commit", "-q", "-m", "base")
+    git("tag", "base")
+    git("mv", "docs/d/s/old.md", "docs/d/s/новый.md")
+    (tmp_path / "docs" / "d" / "s" / "keep.md").write_text("# Keep\nmore\n", encoding="utf-8")
+    git("commit", "-q", "-am", "change")
+
+    monkeypatch.chdir(tmp_path)
+    changes = _git_changes("base", Path("docs"))
+
+    assert changes is not None
+    by_op = {c.op: c for c in changes}
+    assert by_op["M"].path == "docs/d/s/keep.md"
+    assert by_op["R"].path == "docs/d/s/old.md" and by_op["R"].new_path == "docs/d/s/новый.md"
+    assert _git_changes("no-such-ref", Path("docs")) is None
+
+
+def test_converter_opts_coerce_yaml_values_once() -> None:
+    opts = ConverterOpts.from_options({"toc": 0, "toc_max": "4", "heading_numbering": False, "parallel": 16})
+
+    assert opts.inject_toc is False
+    assert opts.toc_max_level == 4
+    assert opts.heading_numbering_in_text is False
+    # publisher-only options don't end up in the converter options (and cache key)
+    assert opts == ConverterOpts.from_options({"toc": 0, "toc_max": 4, "heading_numbering": False})
+
+
+def test_read_all_bodies_keeps_path_order(tmp_path: Path) -> None:
+    from publish_docs import _read_all_bodies
+
+    paths = []
+    for i in range(5):
+        p = tmp_path / f"f{i}.md"
+        p.write_text(f"# {i}\n", encoding="utf-8")
+        paths.append(p)
+
+    assert _read_all_bodies(paths, workers=3) == [f"# {i}\n" for i in range(5)]
+    assert _read_all_bodies(paths, workers=1) == _read_all_bodies(paths, workers=3)
+
+
+def test_parse_paths_file_tabbed_lines_and_edge_whitespace(tmp_path: Path) -> None:
+    docs_dir = tmp_path / "docs"
+    f = tmp_path / "changed.txt"
+    f.write_text(
+        "  M\tdocs/a b/x.md  \n"
+        "\tdocs/plain.md\t\n"
+        "R087\tdocs/old.md\tdocs/new name.md\n"
+        "M\tdocs/skip.txt\n"
+        "   \n"
+        "  # M docs/comment.md\n",
+        encoding="utf-8",
+    )
+
+    changes = _parse_paths_file(f, docs_dir, root=tmp_path)
+
+    assert [(c.op, c.path, c.new_path) for c in changes] == [
+        ("M", "docs/a b/x.md", None),
+        ("M", "docs/plain.md", None),
+        ("R", "docs/old.md", "docs/new name.md"),
+    ]